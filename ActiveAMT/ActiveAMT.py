@@ -3,8 +3,12 @@ import threading
 import time
 
 from ActiveAMT_CLIB import Clib
+from ActiveAMT_DB import HITDbHandler
+from ActiveAMT_EVENTS.batcher import Batcher
+from ActiveAMT_EVENTS.dispatcher import Dispatcher
 from ActiveAMT_EVENTS.observable import Observable
-from ActiveAMT_FLASK import app, ssl_ctx
+from ActiveAMT_FLASK import app, ssl_ctx, _cert, _key
+from ActiveAMT_FLASK.Custom_Templates import custom_templates
 
 building_HTML = True
 debugging = False
@@ -16,17 +20,28 @@ class ActiveAMT(object):
     Class to provide the whole ActiveAMT functionality
     """
 
-    def __init__(self):
-        self._flask_thread = _FlaskThread()
+    def __init__(self, production_server=False, server_threads=30, prewarm_templates=False):
+        """
+        By default the HITs are served by the Flask development server.
+        Pass production_server=True to serve them with cheroot's WSGI server instead,
+        handling up to server_threads requests at once. This needs cheroot to be installed.
+
+        Pass prewarm_templates=True to compile the templates of the outstanding custom HTML HITs
+        before the server starts, instead of on their first view.
+        """
+        self._flask_thread = _FlaskThread(production_server, server_threads, prewarm_templates)
         self._observable = Observable()
         if not debugging:
             log = logging.getLogger('werkzeug')
             log.setLevel(logging.ERROR)
         self.clib = Clib()
 
-    def init_tasks(self, tasks, hit_type_init_file=None):
+    def init_tasks(self, tasks, hit_type_init_file=None, chunk_size=None, num_workers=None):
         """
         Takes a list of tasks and turns them into HITs on AMT.
+
+        HITs are recorded in the HIT database chunk_size at a time, and are created on AMT by num_workers
+        threads at once (see Clib.create_hits).
         """
         if not type(tasks) is list:
             # If only a single, non-list held task was passed in, add it to a list
@@ -39,10 +54,15 @@ class ActiveAMT(object):
 
         global _flask_running
         if not _flask_running:  # Only allow one Flask server to be running
+            if self._flask_thread.ident is not None:
+                # The server this instance started earlier has stopped, and a thread can only be started once
+                old_thread = self._flask_thread
+                self._flask_thread = _FlaskThread(old_thread.production_server, old_thread.server_threads,
+                                                  old_thread.prewarm_templates)
             self._flask_thread.start()
         time.sleep(1)  # Here simply to clean up console output
         if not building_HTML:
-            self.clib.create_hits(tasks, hit_type_init_file)
+            self.clib.create_hits(tasks, hit_type_init_file, chunk_size, num_workers)
 
     def register_observer(self, observer):
         """
@@ -51,14 +71,78 @@ class ActiveAMT(object):
         with self._observable.lock:
             self._observable.register(observer)
 
+    def enable_async_dispatch(self, num_threads=2, max_queue_size=1000):
+        """
+        Deliver events to observers from num_threads background threads instead of the Flask request threads.
+
+        Each observer still gets its events one at a time and in order. Once an observer has max_queue_size
+        events waiting, answer submissions block until it catches up (see get_dispatch_metrics).
+        """
+        self._replace_dispatcher(Dispatcher(num_threads, max_queue_size))
+
+    def disable_async_dispatch(self):
+        """
+        Deliver any queued events, then go back to updating observers inline.
+        """
+        self._replace_dispatcher(None)
+
+    def get_dispatch_metrics(self):
+        """
+        Returns the metrics of the async dispatcher, or None if observers are being updated inline.
+        """
+        dispatcher = self._observable.dispatcher
+
+        if dispatcher is None:
+            return None
+
+        return dispatcher.get_metrics()
+
+    def enable_batching(self, max_events=100, window_seconds=1.0):
+        """
+        Collect completed HITs and hand them to observers as update(completed_tasks=[...], remaining_tasks=...),
+        once max_events HITs are collected or window_seconds after the first one, whichever comes first.
+        Pass window_seconds=None to only batch by count.
+        """
+        self._replace_batcher(Batcher(self._observable.deliver, max_events, window_seconds))
+
+    def disable_batching(self):
+        """
+        Deliver the pending batch, then go back to handing observers one completed_task at a time.
+        """
+        self._replace_batcher(None)
+
+    def _replace_batcher(self, batcher):
+        """
+        Helper to swap in a new batcher, delivering what the old one had collected.
+        """
+        with self._observable.lock:
+            old_batcher = Observable.set_batcher(batcher)
+
+        if old_batcher is not None:
+            old_batcher.flush()
+
+    def _replace_dispatcher(self, dispatcher):
+        """
+        Helper to swap in a new dispatcher, stopping the old one once nothing can dispatch to it anymore.
+        """
+        with self._observable.lock:
+            old_dispatcher = Observable.set_dispatcher(dispatcher)
+
+        if old_dispatcher is not None:
+            old_dispatcher.stop()
+
 
 class _FlaskThread(threading.Thread):
     """
     Thread class for the Flask server.
     """
 
-    def __init__(self):
+    def __init__(self, production_server=False, server_threads=30, prewarm_templates=False):
         threading.Thread.__init__(self)
+        self.production_server = production_server
+        self.server_threads = server_threads
+        self.prewarm_templates = prewarm_templates
+        self._server = None
 
     def run(self):
         """
@@ -67,4 +151,44 @@ class _FlaskThread(threading.Thread):
         global _flask_running
         _flask_running = True
         print("\nA Flask server has been spawned on {}".format(self.name))
-        app.run(debug=True, ssl_context=ssl_ctx, use_reloader=False, host='0.0.0.0', threaded=True)
+
+        if self.prewarm_templates:
+            custom_templates.prewarm(HITDbHandler().get_remaining_html_files())
+
+        if self.production_server:
+            self._run_production_server()
+        else:
+            app.run(debug=True, ssl_context=ssl_ctx, use_reloader=False, host='0.0.0.0', threaded=True)
+
+        _flask_running = False
+
+    def _run_production_server(self):
+        """
+        Serve the Flask app over TLS with cheroot, until shutdown() is called.
+
+        The server is a single process, so observers registered in this process see every answer.
+        """
+        try:
+            from cheroot import wsgi
+            from cheroot.ssl.builtin import BuiltinSSLAdapter
+        except ImportError:
+            raise ImportError("The production server needs cheroot, install it with 'pip install cheroot'.")
+
+        def app_with_shutdown_hook(environ, start_response):
+            # Stands in for the 'werkzeug.server.shutdown' hook the development server provides.
+            environ['activeamt.server.shutdown'] = self.shutdown
+            return app(environ, start_response)
+
+        self._server = wsgi.Server(('0.0.0.0', 5000), app_with_shutdown_hook, numthreads=self.server_threads)
+        self._server.ssl_adapter = BuiltinSSLAdapter(_cert, _key)
+        self._server.ssl_adapter.context = ssl_ctx
+
+        self._server.start()
+
+    def shutdown(self):
+        """
+        Stop the production server, letting the requests in progress finish first.
+        Safe to call from one of the server's own request threads.
+        """
+        if self._server is not None:
+            threading.Thread(target=self._server.stop).start()
@@ -1,7 +1,9 @@
-import copy
-import glob
+import Queue
+import hashlib
 import os
-import shutil
+import tempfile
+import threading
+import uuid
 
 import crowdlib as cl
 import crowdlib_settings as cls
@@ -11,10 +13,17 @@ from ActiveAMT.ActiveAMT_FLASK import server_location, template_map, custom_hit_
 
 class Clib(object):
 
+    # Number of HITs written to the HIT database per transaction by create_hits
+    chunk_size = 100
+    # Number of threads create_hits uses to send CreateHIT requests to AMT. 1 creates HITs one at a time.
+    num_workers = 1
+
     def __init__(self):
         self.db = HITDbHandler()
         self.custom_hit_path = custom_hit_path
         self.server = server_location
+        # Content-hashed custom HIT files this instance knows to exist, see _store_html
+        self._stored_html = set()
 
     def _create_hittype(self, hit_type_init_file=None):
         """
@@ -52,10 +61,14 @@ class Clib(object):
 
     def _make_hit(self, task, hit_type):
         """
-        Creates a HIT for the given task and sends it to the HIT database.
+        Creates a HIT for the given task and returns it, ready to be sent to the HIT database.
+
+        Each call gets its own UniqueRequestToken, so crowdlib can safely retry the CreateHIT request
+        without AMT creating the HIT twice. If an earlier try did create it, that HIT is returned.
         """
 
-        hit = hit_type.create_hit("{}{}".format(self.server, task['template']), 650)
+        hit = hit_type.create_hit("{}{}".format(self.server, task['template']), 650,
+                                  unique_request_token=uuid.uuid4().hex)
 
         print("\n\t****Generated HIT: {}****".format(hit.id))
 
@@ -65,7 +78,7 @@ class Clib(object):
             'answer': ""
         }
 
-        self.db.add_to_db(hit_for_db)
+        return hit_for_db
 
     def _eqval(self, str_val):
         """
@@ -90,7 +103,7 @@ class Clib(object):
 
         Does not manipulate any of the task attributes.
         Simply makes sure the task is valid and gets the necessary HTML into the correct flask path.
-        Also flattens variables dict into a string to store in the db.
+        Also makes sure the variables, if any, are a dict so they can be stored in the db.
         """
 
         # If the user provided a desired filename, use the filename for the new flask template file
@@ -106,54 +119,100 @@ class Clib(object):
             if os.path.exists(task['path']):
                 # Use the desired filename if it was provided
                 if 'fname' in task:
-                    shutil.copy(task['path'], (self.custom_hit_path + '/' + task['html']))
-                # If a desired filename was not provided, just use the existing filename
+                    html_file = open(task['path'])
+                    self._write_html(task['html'], html_file.read())
+                    html_file.close()
+                # If a desired filename was not provided, store the HTML under its content hash
                 else:
-                    shutil.copy(task['path'], (self.custom_hit_path + '/' + task['path'].split('/')[-1]))
-                    task['html'] = task['path'].split('/')[-1]  # Should be just the filename.html
+                    html_file = open(task['path'])
+                    task['html'] = self._store_html(html_file.read())
+                    html_file.close()
             else:
                 raise UserWarning("{} does not exist!".format(task['path']))
         # If the user does not provide an HTML file, they must provide raw HTML
         elif 'raw' in task:
-            # If the user doesn't have a desired filename, name the new file custom_hit#, where the number is sequential
+            # If the user doesn't have a desired filename, store the HTML under its content hash
             if 'fname' not in task:
-                cur_custom_hits = glob.glob1(self.custom_hit_path, 'custom_hit*.html')
-                num_custom_hits = len(cur_custom_hits) + 1
-                new_custom_hit = open(self.custom_hit_path + '/custom_hit{}.html'.format(num_custom_hits), 'w')
-                new_custom_hit.write(task['raw'])
-                new_custom_hit.close()
-                task['html'] = 'custom_hit{}.html'.format(num_custom_hits)
+                task['html'] = self._store_html(task['raw'])
             # Otherwise, use the desired filename
             else:
-                new_custom_hit = open((self.custom_hit_path + '/' + task['fname']), 'w')
-                new_custom_hit.write(task['raw'])
-                new_custom_hit.close()
+                self._write_html(task['fname'], task['raw'])
         else:
             raise KeyError("You must provide either a path to your HTML file with the 'path' key or the raw HTML "
                            "with the 'raw' key!")
 
-        flat_dict = ""
-
         if 'variables' in task:
 
             if not type(task['variables']) is dict:
                 raise KeyError("'variables' must be a dict of key-val pairs, each being a variable to be injected into "
                                "the HTML.")
 
-            task['db_vars'] = copy.deepcopy(task['variables'])
+        return task
 
-            for key, value in task['db_vars'].iteritems():
-                flat_dict += "{}:{},".format(key, value)
+    def _store_html(self, html):
+        """
+        Writes custom HIT HTML into the flask path, named after a hash of its content, returning the filename.
 
-            task['db_vars'] = flat_dict
+        Tasks with identical HTML share one file, so it is only written the first time it is seen.
+        """
+        if isinstance(html, unicode):
+            html = html.encode('utf-8')
 
-        return task
+        fname = 'custom_hit_{}.html'.format(hashlib.sha1(html).hexdigest())
+
+        if fname not in self._stored_html and not os.path.exists(self.custom_hit_path + '/' + fname):
+            self._write_html(fname, html)
+
+        self._stored_html.add(fname)
 
-    def create_hits(self, tasks, hit_type_init_file=None):
+        return fname
+
+    def _write_html(self, fname, html):
+        """
+        Writes HTML to the custom HIT file fname in the flask path, atomically.
+
+        The HTML goes to a temporary file that is then renamed over fname, so a HIT being rendered, or another
+        process storing the same HTML at the same time, never sees a partly written file.
+        """
+        if isinstance(html, unicode):
+            html = html.encode('utf-8')
+
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', prefix='.' + fname, dir=self.custom_hit_path)
+
+        try:
+            new_custom_hit = os.fdopen(fd, 'w')
+            new_custom_hit.write(html)
+            new_custom_hit.close()
+            os.chmod(temp_path, 0644)
+            os.rename(temp_path, self.custom_hit_path + '/' + fname)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def create_hits(self, tasks, hit_type_init_file=None, chunk_size=None, num_workers=None):
         """
         Combines the methods from above to generate a HIT for each task
+
+        Generated HITs are written to the HIT database in chunks of chunk_size, one transaction per chunk.
+        If a chunk fails to be written, only that chunk is rolled back; earlier chunks stay in the database.
+        If creating HITs fails partway, the HITs already made on AMT are still written before the error is raised.
+
+        With num_workers greater than 1, the CreateHIT requests are sent to AMT from a pool of that many threads.
+        crowdlib still spaces the requests to the service's requests-per-second limit.
         """
 
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+
+        if num_workers is None:
+            num_workers = self.num_workers
+
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1!")
+
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1!")
+
         # Must create the HITType in order to create a HIT
         hit_type = self._create_hittype(hit_type_init_file)
 
@@ -165,4 +224,123 @@ class Clib(object):
                 task = self._handle_html_task(task)
 
             task['template'] = template_map[task['type']]
-            self._make_hit(task, hit_type)
+
+        if num_workers > 1:
+            self._make_hits_concurrently(tasks, hit_type, chunk_size, num_workers)
+            return
+
+        hits_for_db = []
+
+        try:
+            for task in tasks:
+                hits_for_db.append(self._make_hit(task, hit_type))
+
+                if len(hits_for_db) >= chunk_size:
+                    self.db.add_many(hits_for_db)
+                    hits_for_db = []
+
+            # Write whatever is left over from the last, partial chunk
+            self.db.add_many(hits_for_db)
+            hits_for_db = []
+        finally:
+            # If a HIT could not be made, or a chunk could not be written, the HITs of the chunk that were already
+            # made on AMT still get their rows before the error is raised
+            self._add_pending_hits(hits_for_db)
+
+    def _add_pending_hits(self, hits):
+        """
+        Writes HITs that were made on AMT but not yet written to the HIT database, after creating HITs has failed.
+
+        The HITs are written in one transaction if possible, otherwise one at a time, so that a single bad row
+        (i.e. a HIT that is already in the database) does not lose the others. HITs that still could not be
+        written are reported by id.
+        """
+        if not hits:
+            return
+
+        try:
+            self.db.add_many(hits)
+            return
+        except Exception:
+            pass
+
+        for hit in hits:
+            try:
+                self.db.add_many([hit])
+            except Exception as e:
+                print("\n\t****Could not write HIT[{}] to the database: {}****".format(hit['id'], e))
+
+    def _make_hits_concurrently(self, tasks, hit_type, chunk_size, num_workers):
+        """
+        Creates the HITs for the given tasks from a pool of worker threads.
+
+        The calling thread collects the HITs as the workers finish them and writes them to the HIT database
+        chunk_size at a time. If any task fails, the remaining tasks are still attempted, every HIT that was
+        created is still written to the database, and the first error is raised at the end.
+
+        If writing to the database fails, the workers are stopped and joined, and the HITs they already made are
+        written (as far as the database allows) before that error is raised, so no HIT is left on AMT unrecorded.
+        """
+
+        task_queue = Queue.Queue()
+        result_queue = Queue.Queue()
+        # Set when the HITs can no longer be written, so the workers stop making new ones
+        stop = threading.Event()
+
+        for task in tasks:
+            task_queue.put(task)
+
+        def worker():
+            while not stop.is_set():
+                try:
+                    task = task_queue.get_nowait()
+                except Queue.Empty:
+                    return
+
+                try:
+                    result_queue.put((self._make_hit(task, hit_type), None))
+                except Exception as e:
+                    result_queue.put((task, e))
+
+        workers = [threading.Thread(target=worker) for _ in range(min(num_workers, len(tasks)))]
+        for thread in workers:
+            thread.daemon = True
+            thread.start()
+
+        hits_for_db = []
+        errors = []
+
+        try:
+            for _ in range(len(tasks)):
+                hit_for_db, error = result_queue.get()
+
+                if error is not None:
+                    print("\n\t****Failed to generate a HIT: {}****".format(error))
+                    errors.append(error)
+                    continue
+
+                hits_for_db.append(hit_for_db)
+
+                if len(hits_for_db) >= chunk_size:
+                    self.db.add_many(hits_for_db)
+                    hits_for_db = []
+
+            self.db.add_many(hits_for_db)
+            hits_for_db = []
+        finally:
+            stop.set()
+
+            for thread in workers:
+                thread.join()
+
+            # Only left over if writing failed:  the unwritten chunk and whatever the workers made meanwhile
+            while not result_queue.empty():
+                hit_for_db, error = result_queue.get()
+                if error is None:
+                    hits_for_db.append(hit_for_db)
+
+            self._add_pending_hits(hits_for_db)
+
+        if errors:
+            print("\n{} of {} task(s) could not be turned into HITs.".format(len(errors), len(tasks)))
+            raise errors[0]
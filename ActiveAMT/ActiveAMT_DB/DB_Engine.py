@@ -0,0 +1,84 @@
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+# SQLite connection settings, applied to every new connection. Change these before the engines are created.
+# WAL lets the Flask threads read while an answer is being written, and with synchronous=NORMAL a commit
+# only waits on the WAL file rather than the whole database. busy_timeout is how long a writer waits on
+# another one's lock before failing with 'database is locked'.
+sqlite_journal_mode = 'WAL'
+sqlite_synchronous = 'NORMAL'
+sqlite_busy_timeout_ms = 30000
+
+# Seconds after which a pooled connection to a database server is replaced, before the server drops it.
+pool_recycle = 1800
+
+
+def sqlite_path(db_url):
+    """
+    Return the file a SQLite URL points at, or None if the URL is for another database or an in-memory one.
+    """
+    url = make_url(db_url)
+
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+
+    return url.database
+
+
+def create_db_engine(db_url, pool_size=5, max_overflow=10, pool_timeout=30, journal_mode=None):
+    """
+    Create an engine for db_url, set up for the kind of database it points at.
+
+    SQLite connections are shared between threads and get the sqlite_* pragmas above. journal_mode overrides
+    sqlite_journal_mode, pass False to leave the file's journal mode as it is.
+    Connections to a database server are checked before being handed out and recycled every pool_recycle
+    seconds, so one the server closed in the meantime is replaced rather than failing the request.
+    """
+    url = make_url(db_url)
+
+    if url.get_backend_name() != 'sqlite':
+        return create_engine(url,
+                             pool_size=pool_size,
+                             max_overflow=max_overflow,
+                             pool_timeout=pool_timeout,
+                             pool_recycle=pool_recycle,
+                             pool_pre_ping=True)
+
+    engine = create_engine(url,
+                           poolclass=QueuePool,
+                           pool_size=pool_size,
+                           max_overflow=max_overflow,
+                           pool_timeout=pool_timeout,
+                           connect_args={'check_same_thread': False,
+                                         'timeout': sqlite_busy_timeout_ms / 1000.0})
+
+    if journal_mode is None:
+        journal_mode = sqlite_journal_mode
+
+    # An in-memory database has no file to keep a WAL next to
+    if sqlite_path(db_url) is None:
+        journal_mode = False
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if journal_mode:
+            cursor.execute('PRAGMA journal_mode={}'.format(journal_mode))
+        cursor.execute('PRAGMA synchronous={}'.format(sqlite_synchronous))
+        cursor.execute('PRAGMA busy_timeout={}'.format(int(sqlite_busy_timeout_ms)))
+        cursor.close()
+
+    return engine
+
+
+def remove_sqlite_files(path):
+    """
+    Delete a SQLite database file along with its WAL and shared memory files, if there are any.
+    Every engine on the file must be disposed of first.
+    """
+    for file_path in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(file_path):
+            os.remove(file_path)
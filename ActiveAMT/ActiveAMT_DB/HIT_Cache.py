@@ -0,0 +1,90 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+class HITCache(object):
+    """
+    Bounded, thread-safe LRU cache of HIT dicts, keyed by HIT id.
+
+    Entries expire ttl_seconds after being cached, and the least recently used entry is dropped
+    once there are max_size of them. Callers always get their own copy of a cached HIT.
+    """
+
+    def __init__(self, max_size=1024, ttl_seconds=300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        # Bumped on every invalidation, see put().
+        self._generation = 0
+
+    def get(self, hit_id):
+        """
+        Return a copy of the cached HIT, or None if it is not cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.pop(hit_id, None)
+
+            if entry is None or entry[0] < time.time():
+                self._misses += 1
+                return None
+
+            # Re-inserting moves the entry to the most recently used end.
+            self._entries[hit_id] = entry
+            self._hits += 1
+
+            return copy.deepcopy(entry[1])
+
+    def get_generation(self):
+        """
+        Return the current generation, to be passed to put() after reading the HIT from the database.
+        """
+        with self._lock:
+            return self._generation
+
+    def put(self, hit_id, hit, generation):
+        """
+        Cache a copy of the HIT. Nothing is cached if anything was invalidated since generation was taken,
+        as the HIT may have been read from the database before that change was made.
+        """
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            self._entries.pop(hit_id, None)
+            self._entries[hit_id] = (time.time() + self.ttl_seconds, copy.deepcopy(hit))
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, hit_id):
+        """
+        Drop the HIT from the cache, if it is there.
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(hit_id, None)
+
+    def clear(self):
+        """
+        Drop every HIT from the cache.
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def get_stats(self):
+        """
+        Return a dict of the hit and miss counters and the number of cached HITs.
+        """
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'size': len(self._entries)
+            }
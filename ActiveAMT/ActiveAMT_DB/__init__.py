@@ -1,3 +1,6 @@
 from HIT_DB import HITDbHandler
+from HIT_DB import RemainingHITs
 from HIT_DB import db_location as hit_db_location
+from HIT_DB import drop_db as drop_hit_db
+from HIT_DB import hit_cache
 
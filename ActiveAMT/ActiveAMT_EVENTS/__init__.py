@@ -1,2 +1,4 @@
 from ActiveAMT.ActiveAMT_EVENTS import observer
-from ActiveAMT.ActiveAMT_EVENTS import observable
\ No newline at end of file
+from ActiveAMT.ActiveAMT_EVENTS import observable
+from ActiveAMT.ActiveAMT_EVENTS import dispatcher
+from ActiveAMT.ActiveAMT_EVENTS import batcher
\ No newline at end of file
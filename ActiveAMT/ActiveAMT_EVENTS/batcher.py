@@ -0,0 +1,73 @@
+import threading
+
+
+class Batcher(object):
+    """
+    Collects HIT completion events and hands them on as one event per batch.
+
+    A batch is delivered once it holds max_events completions, or window_seconds after its first
+    completion, whichever comes first. Its observers get a single
+    update(completed_tasks=[...], remaining_tasks=...), where remaining_tasks is the one from the
+    latest completion in the batch.
+    """
+
+    def __init__(self, deliver, max_events=100, window_seconds=1.0):
+        if max_events < 1:
+            raise ValueError("max_events must be at least 1!")
+        if window_seconds is not None and window_seconds <= 0:
+            raise ValueError("window_seconds must be positive, or None to only batch by count!")
+
+        self.deliver = deliver
+        self.max_events = max_events
+        self.window_seconds = window_seconds
+
+        self._lock = threading.Lock()
+        # Held while a batch is taken and delivered, so batches reach observers in the order they were collected.
+        self._flush_lock = threading.Lock()
+        self._completed_tasks = []
+        self._remaining_tasks = None
+        self._has_remaining_tasks = False
+        self._timer = None
+
+    def add(self, completed_task, **kwargs):
+        """
+        Add a completion event to the current batch, delivering the batch if it is now full.
+        """
+        with self._lock:
+            self._completed_tasks.append(completed_task)
+
+            if 'remaining_tasks' in kwargs:
+                self._remaining_tasks = kwargs['remaining_tasks']
+                self._has_remaining_tasks = True
+
+            batch_full = len(self._completed_tasks) >= self.max_events
+
+            if not batch_full and self._timer is None and self.window_seconds is not None:
+                self._timer = threading.Timer(self.window_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if batch_full:
+            self.flush()
+
+    def flush(self):
+        """
+        Deliver the current batch now, if there is one.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+
+                completed_tasks = self._completed_tasks
+                kwargs = {'completed_tasks': completed_tasks}
+                if self._has_remaining_tasks:
+                    kwargs['remaining_tasks'] = self._remaining_tasks
+
+                self._completed_tasks = []
+                self._remaining_tasks = None
+                self._has_remaining_tasks = False
+
+            if completed_tasks:
+                self.deliver(**kwargs)
@@ -0,0 +1,129 @@
+import Queue
+import threading
+import time
+import traceback
+
+
+class Dispatcher(object):
+    """
+    Delivers events to observers from a pool of dispatcher threads, so the thread raising the event
+    (ex. a Flask request thread) does not wait on the observers.
+
+    Each dispatcher thread has its own bounded queue, and each observer is always delivered to by the
+    same thread, so an observer sees its events one at a time and in the order they were raised.
+    When an observer's queue is full, dispatch() blocks until there is room. The metrics show how
+    often and for how long that happened.
+    """
+
+    def __init__(self, num_threads=2, max_queue_size=1000):
+        if num_threads < 1:
+            raise ValueError("A dispatcher needs at least 1 thread!")
+        if max_queue_size < 1:
+            raise ValueError("max_queue_size must be at least 1!")
+
+        self.num_threads = num_threads
+        self.max_queue_size = max_queue_size
+
+        self._queues = [Queue.Queue(max_queue_size) for _ in range(num_threads)]
+        self._threads = []
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'dispatched': 0,
+            'delivered': 0,
+            'failed': 0,
+            'blocked': 0,
+            'blocked_seconds': 0.0
+        }
+
+        for num, queue in enumerate(self._queues):
+            thread = threading.Thread(target=self._deliver_from, args=(queue,), name='ActiveAMTDispatcher-{}'.format(num))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def dispatch(self, observer, *args, **kwargs):
+        """
+        Queue up a call of observer.update(*args, **kwargs), blocking while the observer's queue is full.
+        """
+        if not self._threads:
+            raise RuntimeError("This dispatcher has been stopped!")
+
+        queue = self._queues[hash(observer) % self.num_threads]
+        event = (observer, args, kwargs)
+
+        try:
+            queue.put_nowait(event)
+            blocked_seconds = None
+        except Queue.Full:
+            started = time.time()
+            queue.put(event)
+            blocked_seconds = time.time() - started
+
+        with self._metrics_lock:
+            self._metrics['dispatched'] += 1
+            if blocked_seconds is not None:
+                self._metrics['blocked'] += 1
+                self._metrics['blocked_seconds'] += blocked_seconds
+
+    def wait_until_idle(self):
+        """
+        Block until every event dispatched so far has been delivered.
+        """
+        for queue in self._queues:
+            queue.join()
+
+    def stop(self):
+        """
+        Deliver whatever is still queued, then stop the dispatcher threads.
+        """
+        for queue in self._queues:
+            queue.put(None)
+
+        for thread in self._threads:
+            thread.join()
+
+        self._threads = []
+
+    def get_metrics(self):
+        """
+        Return a dict of counters for the dispatcher:
+
+            dispatched = events queued so far
+            delivered = events whose update() returned
+            failed = events whose update() raised
+            blocked = dispatch() calls that had to wait for room on a full queue
+            blocked_seconds = total time spent waiting for room
+            queue_depths = events currently waiting, per dispatcher thread
+        """
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+
+        metrics['queue_depths'] = [queue.qsize() for queue in self._queues]
+
+        return metrics
+
+    def _deliver_from(self, queue):
+        """
+        Dispatcher thread loop. An observer raising is reported, but does not stop delivery to the others.
+        """
+        while True:
+            event = queue.get()
+
+            try:
+                if event is None:
+                    return
+
+                observer, args, kwargs = event
+
+                try:
+                    observer.update(*args, **kwargs)
+                    outcome = 'delivered'
+                except Exception:
+                    print("\nObserver {} failed to handle an event:".format(observer))
+                    traceback.print_exc()
+                    outcome = 'failed'
+
+                with self._metrics_lock:
+                    self._metrics[outcome] += 1
+            finally:
+                queue.task_done()
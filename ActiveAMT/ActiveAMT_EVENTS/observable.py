@@ -6,6 +6,13 @@ class Observable(object):
     observers = []
     lock = threading.Lock()
 
+    # When None, observers are updated inline by the thread raising the event.
+    # Otherwise a dispatcher.Dispatcher, which delivers events from its own threads.
+    dispatcher = None
+
+    # When not None, a batcher.Batcher that completion events are collected in before being delivered.
+    batcher = None
+
     def __init__(self):
         pass
 
@@ -29,9 +36,54 @@ class Observable(object):
         """
         self.observers = []
 
+    @classmethod
+    def set_dispatcher(cls, dispatcher):
+        """
+        Sets the dispatcher used by every observable. Pass None to go back to updating observers inline.
+        Returns the dispatcher that was replaced, if any, so it can be stopped.
+        """
+        old_dispatcher = cls.dispatcher
+        cls.dispatcher = dispatcher
+
+        return old_dispatcher
+
+    @classmethod
+    def set_batcher(cls, batcher):
+        """
+        Sets the batcher used by every observable. Pass None to deliver every event on its own again.
+        Returns the batcher that was replaced, if any, so it can be flushed.
+        """
+        old_batcher = cls.batcher
+        cls.batcher = batcher
+
+        return old_batcher
+
     def notify_observers(self, *args, **kwargs):
         """
         Notifies all of the observers when an event happens.
+
+        If batching is on, HIT completion events are held back and delivered a batch at a time.
+        Any other event first delivers the pending batch, so observers still see events in order.
         """
-        for observer in self.observers:
-            observer.update(*args, **kwargs)
+        batcher = self.batcher
+
+        if batcher is not None:
+            if not args and 'completed_task' in kwargs:
+                batcher.add(**kwargs)
+                return
+
+            batcher.flush()
+
+        self.deliver(*args, **kwargs)
+
+    def deliver(self, *args, **kwargs):
+        """
+        Hands an event to all of the observers, skipping any batching.
+        """
+        dispatcher = self.dispatcher
+
+        for observer in list(self.observers):
+            if dispatcher is None:
+                observer.update(*args, **kwargs)
+            else:
+                dispatcher.dispatch(observer, *args, **kwargs)
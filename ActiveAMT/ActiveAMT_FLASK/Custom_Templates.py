@@ -0,0 +1,91 @@
+import hashlib
+import os
+import threading
+
+from jinja2 import TemplateNotFound
+
+from ActiveAMT.ActiveAMT_FLASK import app, flask_dir
+
+
+class CustomTemplateStore(object):
+    """
+    Compiled templates for custom HTML HITs, stored by a hash of their HTML.
+
+    However many custom HIT files hold the same HTML, it is compiled once, and each HIT only adds its
+    own variables when rendered. This keeps custom HITs out of Jinja's own (bounded) template cache,
+    which thousands of distinct custom HIT files would otherwise keep evicting.
+    """
+
+    def __init__(self, template_dir):
+        self.template_dir = template_dir
+
+        self._lock = threading.Lock()
+        # Content hash -> compiled template
+        self._templates = {}
+        # Filename -> (modification time, content hash), so a file is only re-read when it changes
+        self._files = {}
+
+    def get_template(self, name):
+        """
+        Return the compiled template for the custom HIT file called name, compiling it if its HTML is new.
+        Raises TemplateNotFound if there is no such file, as render_template would.
+        """
+        path = os.path.join(self.template_dir, name)
+
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            raise TemplateNotFound('HITs/Custom/' + name)
+
+        with self._lock:
+            known_file = self._files.get(name)
+            if known_file is not None and known_file[0] == mtime:
+                return self._templates[known_file[1]]
+
+        with open(path) as html_file:
+            source = html_file.read().decode('utf-8')
+
+        content_hash = hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+        with self._lock:
+            if content_hash not in self._templates:
+                self._templates[content_hash] = app.jinja_env.from_string(source)
+            self._files[name] = (mtime, content_hash)
+
+            return self._templates[content_hash]
+
+    def render(self, name, **context):
+        """
+        Render the custom HIT file called name with the given context, as render_template would.
+        """
+        template = self.get_template(name)
+        app.update_template_context(context)
+
+        return template.render(context)
+
+    def prewarm(self, names):
+        """
+        Compile the templates for the given custom HIT files ahead of time.
+        Files that no longer exist are skipped.
+        """
+        num_compiled = 0
+
+        for name in set(names):
+            if name and os.path.exists(os.path.join(self.template_dir, name)):
+                self.get_template(name)
+                num_compiled += 1
+
+        print("\nPre-compiled the templates of {} custom HIT file(s)".format(num_compiled))
+
+    def get_stats(self):
+        """
+        Return a dict of the number of custom HIT files seen and of distinct templates compiled for them.
+        """
+        with self._lock:
+            return {
+                'files': len(self._files),
+                'templates': len(self._templates)
+            }
+
+
+custom_templates = CustomTemplateStore(flask_dir + 'templates/HITs/Custom')
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class SubmissionLog(object):
+    """
+    Bounded, thread-safe record of the submission ids that answers were recently posted with.
+
+    answer_collector.js keeps re-sending a submission, with the same id, until the server has confirmed it.
+    A submission that got through but was never confirmed (ex. the worker's page was closed first) arrives
+    again, and is recognised here. Ids are forgotten ttl_seconds after being claimed, or once there are
+    max_size newer ones.
+    """
+
+    def __init__(self, max_size=10000, ttl_seconds=86400):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._claimed = OrderedDict()
+        self._duplicates = 0
+
+    def claim(self, submission_id):
+        """
+        Record the submission id, returning True if it was not claimed already.
+        """
+        with self._lock:
+            now = time.time()
+
+            # Ids are claimed in order, so the expired ones are all at the front.
+            while self._claimed and self._claimed.itervalues().next() < now:
+                self._claimed.popitem(last=False)
+
+            if submission_id in self._claimed:
+                self._duplicates += 1
+                return False
+
+            self._claimed[submission_id] = now + self.ttl_seconds
+
+            while len(self._claimed) > self.max_size:
+                self._claimed.popitem(last=False)
+
+            return True
+
+    def release(self, submission_id):
+        """
+        Forget the submission id, so a submission that could not be stored is accepted when it is re-sent.
+        """
+        with self._lock:
+            self._claimed.pop(submission_id, None)
+
+    def get_stats(self):
+        """
+        Return a dict of the number of ids remembered and of duplicate submissions recognised.
+        """
+        with self._lock:
+            return {
+                'claimed': len(self._claimed),
+                'duplicates': self._duplicates
+            }
+
+
+submission_log = SubmissionLog()
@@ -1,25 +1,42 @@
-from flask import render_template, request, session
+import json
+from collections import OrderedDict
+from urlparse import urlparse
 
-from ActiveAMT.ActiveAMT_DB import HITDbHandler
+from flask import render_template, request, url_for
+from werkzeug.urls import url_decode
+
+from ActiveAMT.ActiveAMT_DB import HITDbHandler, RemainingHITs
 from ActiveAMT.ActiveAMT_EVENTS.observable import Observable
 from ActiveAMT.ActiveAMT_FLASK import app
+from ActiveAMT.ActiveAMT_FLASK.Custom_Templates import custom_templates
+from ActiveAMT.ActiveAMT_FLASK.Submissions import submission_log
 
 hit_db = HITDbHandler()
 observable = Observable()
 
 
+@app.context_processor
+def answer_endpoint():
+    """
+    Gives every template the URL answers are POSTed to, for answer_collector.js.
+    It is on the host the HIT page was served from, so it also works behind another address than the default.
+    """
+    return {'answer_endpoint': url_for('get_answers', _external=True)}
+
+
 @app.route('/text_hit.html')
 def text_hit():
     """
     Shows the template for a HIT of type 'txt'.
     """
-    get_url_params(request.args)
+    hit_info = get_url_params(request.args)
 
-    if 'hitId' in session:
-        db_hit = hit_db.get_hit_by_id(session['hitId'])
-        session['hit_quest'] = db_hit['question']
+    if hit_info['hitId']:
+        db_hit = hit_db.get_hit_by_id(hit_info['hitId'])
+        hit_info['hit_quest'] = db_hit['question']
 
-    return render_template('HITs/text_hit.html', enabled=is_enabled(), hit_info=session, css='HITs/text_hit.css')
+    return render_template('HITs/text_hit.html', enabled=is_enabled(hit_info), hit_info=hit_info,
+                           css='HITs/text_hit.css')
 
 
 @app.route('/pict_hit.html')
@@ -27,97 +44,179 @@ def picture_hit():
     """
     Shows the template for a HIT of type 'img'.
     """
-    get_url_params(request.args)
+    hit_info = get_url_params(request.args)
 
-    if 'hitId' in session:
-        db_hit = hit_db.get_hit_by_id(session['hitId'])
+    if hit_info['hitId']:
+        db_hit = hit_db.get_hit_by_id(hit_info['hitId'])
         if 'question' in db_hit:
-            session['hit_quest'] = db_hit['question']
+            hit_info['hit_quest'] = db_hit['question']
         if 'img_src' in db_hit:
-            session['img_src'] = db_hit['img_src']
+            hit_info['img_src'] = db_hit['img_src']
 
-    return render_template('HITs/pict_hit.html', enabled=is_enabled(), hit_info=session, css='HITs/pict_hit.css')
+    return render_template('HITs/pict_hit.html', enabled=is_enabled(hit_info), hit_info=hit_info,
+                           css='HITs/pict_hit.css')
 
 
 @app.route('/custom_hit.html')
 def custom_hit():
     """
     Shows the template for a HIT of type 'html'
+
+    Rendered from the compiled templates in custom_templates rather than through render_template.
     """
-    get_url_params(request.args)
+    hit_info = get_url_params(request.args)
 
     db_hit = None
 
-    if 'hitId' in session:
-        db_hit = hit_db.get_hit_by_id(session['hitId'])
-        session['vars'] = db_hit['variables']
+    if hit_info['hitId']:
+        db_hit = hit_db.get_hit_by_id(hit_info['hitId'])
+        hit_info['vars'] = db_hit['variables']
 
-    return render_template('HITs/Custom/' + db_hit['html'], enabled=is_enabled(), hit_info=session)
+    return custom_templates.render(db_hit['html'], enabled=is_enabled(hit_info), hit_info=hit_info)
 
 
 @app.route('/getAnswers', methods=['POST'])
 def get_answers():
     """
     Collects the answer(s) from a HIT.
-    """
 
-    try:
-        session['answer'] = str(request.form['answers'])
-    except UnicodeEncodeError:
-        session['answer'] = unicode(request.form['answers'])
+    The HIT is identified by the hitId, assignmentId and workerId posted along with the answers.
+    The answers are stored both as a dict, by input name, and as text for display (see parse_answers).
 
-    quest_ans_dict = {}
+    Only the first answer for a HIT is stored and announced to the observers. Later ones, ex. a submission
+    re-sent by answer_collector.js or posted by another server thread or process, are confirmed and dropped.
+    A recently seen submissionId is recognised before even reaching the database.
+    """
+    hit_info = get_answer_params(request)
 
-    # If answer has a ':' in it, we know it was passed back as a flattened dict
-    if ':' in session['answer']:
+    if not hit_info['hitId']:
+        return "No HIT id was submitted with the answer!", 400
 
-        answers = ""
-        first = True
+    try:
+        answers = parse_answers(request.form)
+    except ValueError as e:
+        return "Could not read the answers: {}".format(e), 400
 
-        key_vals = session['answer'].split('/')
+    submission_id = request.form.get('submissionId')
 
-        # Start 1 in, end 1 early, and only select every other.
-        # This accounts for the leading/trailing space and the comma in the middle
-        for pair in key_vals[1:-1:2]:
+    if submission_id and not submission_log.claim(submission_id):
+        return "Thank you for your input!"
 
-            split = pair.split(':')
+    answer = answers_to_text(answers)
 
-            if first:
-                first = False
-                answers += "{}:'{}'".format(split[0], split[1])
-            else:
-                answers = "{}:'{}', ".format(split[0], split[1]) + answers
+    hit_info['answer'] = answer
+    hit_info['answers'] = answers
 
-            quest_ans_dict[split[0]] = split[1]
+    try:
+        completed = hit_db.complete_hit(hit_info['hitId'], answer, answers)
+    except Exception:
+        if submission_id:
+            submission_log.release(submission_id)
+        raise
 
-            session['answer'] = answers
+    if not completed:
+        if hit_db.get_hit_by_id(hit_info['hitId']) is None:
+            return "No HIT with id {} exists!".format(hit_info['hitId']), 400
 
-    hit_db.set_answer_for_hit(session['hitId'], session['answer'])
+        print("\nHIT[{}] was already answered, ignoring another answer.".format(hit_info['hitId']))
+        return "Thank you for your input!"
 
     with observable.lock:
-        observable.notify_observers(remaining_tasks=hit_db.get_remaining_hits(),
-                                    completed_task=session)
+        observable.notify_observers(remaining_tasks=RemainingHITs(hit_db),
+                                    completed_task=hit_info)
 
-    print("\nHIT[{}] answered! Answer: {}".format(session['hitId'], session['answer'] if not quest_ans_dict else quest_ans_dict))
+    print(u"\nHIT[{}] answered! Answer: {}".format(hit_info['hitId'], answer).encode('utf-8'))
 
     return "Thank you for your input!"
 
 
+def parse_answers(form):
+    """
+    Helper function to read the answers posted to /getAnswers into an ordered dict of input name to value.
+
+    answer_collector.js posts them as a JSON object in 'answers_json'.
+    Older templates post 'answers' as either the bare answer to a single input, or as '/name:value/' pairs
+    joined by commas. That format can not hold values containing '/', use JSON for those.
+    Raises ValueError if the answers can not be read.
+    """
+    if 'answers_json' in form:
+        answers = json.loads(form['answers_json'], object_pairs_hook=OrderedDict)
+
+        if not isinstance(answers, dict):
+            raise ValueError("answers_json must be a JSON object of input names to values")
+
+        return answers
+
+    if 'answers' not in form:
+        raise ValueError("no answers were posted")
+
+    answers = OrderedDict()
+    legacy_answer = form['answers']
+
+    # If answer has a ':' in it, we know it was passed back as a flattened dict
+    if ':' not in legacy_answer:
+        answers['answer'] = legacy_answer
+        return answers
+
+    # Start 1 in, end 1 early, and only select every other.
+    # This accounts for the leading/trailing slash and the comma in the middle
+    for pair in legacy_answer.split('/')[1:-1:2]:
+        # Only split on the first ':' so values can contain them
+        name, separator, value = pair.partition(':')
+        if separator:
+            answers[name] = value
+
+    # Free text that just happens to contain a ':' (i.e. "Note: cat", or a URL) has no pairs, keep it whole
+    if not answers:
+        answers['answer'] = legacy_answer
+
+    return answers
+
+
+def answers_to_text(answers):
+    """
+    Helper function to turn the answers dict into the text stored as the HIT's answer.
+    A single answer is stored as is, several as "name:'value', name:'value'".
+    """
+    if len(answers) == 1:
+        return unicode(answers.values()[0])
+
+    return u", ".join(u"{}:'{}'".format(name, value) for name, value in answers.iteritems())
+
+
 def get_url_params(request_args):
     """
     Helper function to extract the parameters from the URL request.
+    Returns them as a new dict, which the rest of the HIT info is added to for the template.
+    """
+    return {
+        'hitId': request_args.get('hitId'),
+        'assignmentId': request_args.get('assignmentId'),
+        'workerId': request_args.get('workerId')
+    }
+
+
+def get_answer_params(answer_request):
     """
-    session['hitId'] = request_args.get('hitId')
-    session['assignmentId'] = request_args.get('assignmentId')
-    session['workerId'] = request_args.get('workerId')
+    Helper function to extract the HIT identity posted along with the answers.
+
+    Custom templates made before the identity was posted only send the answers. Those are posted from the
+    HIT page itself, so fall back to the parameters in the URL of that page.
+    """
+    hit_info = get_url_params(answer_request.form)
+
+    if not hit_info['hitId'] and answer_request.referrer:
+        hit_info = get_url_params(url_decode(urlparse(answer_request.referrer).query))
+
+    return hit_info
 
 
-def is_enabled():
+def is_enabled(hit_info):
     """
     Helper function to check if the HIT should be submittable
     """
     enabled = ""
-    if session['assignmentId'] == 'ASSIGNMENT_ID_NOT_AVAILABLE' or session['assignmentId'] is None:
+    if hit_info['assignmentId'] == 'ASSIGNMENT_ID_NOT_AVAILABLE' or hit_info['assignmentId'] is None:
         enabled = "disabled"
 
     return enabled
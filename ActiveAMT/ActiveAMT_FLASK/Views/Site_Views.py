@@ -1,14 +1,19 @@
-from flask import render_template, request, redirect, session, url_for
+from flask import Response, render_template, request, redirect, session, url_for
 
 from ActiveAMT.ActiveAMT_DB.HIT_DB import HITDbHandler
-from ActiveAMT.ActiveAMT_FLASK import app, UserDbHandler, flask_dir
+from ActiveAMT.ActiveAMT_FLASK import app, UserDbHandler
 
-import time, os, json
+from cStringIO import StringIO
+import csv, itertools, json
 
 hit_db = HITDbHandler()
 user_db = UserDbHandler()
 user_creds = {}
 
+# The columns of an exported HIT, in order, see export_hits
+export_columns = ['id', 'type', 'template', 'img_src', 'question', 'answer', 'answers', 'html', 'variables',
+                  'completed', 'created_at', 'completed_at']
+
 
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 
@@ -62,24 +67,13 @@ def manage_users():
 @app.route('/manageHITs', methods=['GET'])
 def manage_hits():
     """
-    Renders the template for the HIT management page, passing forward all HITs
+    Renders the template for the HIT management page
     """
     if not verify_login(url_for('manage_hits'), True):
         return redirect('login')
 
-    hits = hit_db.get_all_hits()
-
-    for hit in hits:
-        if hit['completed']:
-            hit['completed'] = 'True'
-        else:
-            hit['completed'] = 'False'
-
-        if 'variables' in hit:  # Produces angular error within ng-init
-            del hit['variables']
-
-    return render_template('Site/manage_hits.html', user=session, title="HIT Management", css='manage_hits.css',
-                           hits=hits)
+    # The HITs themselves are fetched a page at a time from /api/hits by manageHITs.js
+    return render_template('Site/manage_hits.html', user=session, title="HIT Management", css='manage_hits.css')
 
 
 @app.route('/shutdown', methods=['POST'])
@@ -93,8 +87,15 @@ def server_shutdown():
         shutdown = True
 
     if shutdown:
+        # The development server and the production server (see ActiveAMT._FlaskThread) each provide a hook.
+        shutdown_hook = request.environ.get('werkzeug.server.shutdown') or \
+            request.environ.get('activeamt.server.shutdown')
+
+        if shutdown_hook is None:
+            return render_template('Site/shutdown_error.html')
+
         try:
-            request.environ.get('werkzeug.server.shutdown')()
+            shutdown_hook()
             return render_template('Site/shutdown.html', user=session)
         except EnvironmentError:
             return render_template('Site/shutdown_error.html')
@@ -198,6 +199,53 @@ def update_user():
     return redirect('/manageUsers')
 
 
+@app.route('/api/hits', methods=['GET'])
+def list_hits():
+    """
+    Streams one page of HITs as JSON: {"hits": [...], "next": <cursor or null>}
+
+    URL parameters:
+        sort = column to sort by, default 'id'
+        desc = 'true' to sort descending
+        limit = HITs per page, default 100, at most 1000
+        after = the "next" cursor of the previous page
+        filter_<column> = text the column must contain, filter_any for any column
+    """
+    if 'username' not in session or not session['is_admin']:
+        return Response(json.dumps({'error': 'You must be logged in as an admin!'}), 401, mimetype='application/json')
+
+    try:
+        page = get_page_params(request.args)
+        hits = hit_db.iter_hits(**page)
+        # Run the query now, so a bad parameter is reported before the response starts
+        first_hit = next(hits, None)
+    except (KeyError, ValueError) as e:
+        return Response(json.dumps({'error': e.args[0]}), 400, mimetype='application/json')
+
+    def stream_page():
+        yield '{"hits": ['
+
+        last_hit = first_hit
+        num_hits = 0
+
+        if first_hit is not None:
+            yield json.dumps(first_hit)
+            num_hits += 1
+
+            for hit in hits:
+                yield ', ' + json.dumps(hit)
+                last_hit = hit
+                num_hits += 1
+
+        next_cursor = None
+        if num_hits == page['limit']:
+            next_cursor = json.dumps(hit_db.page_cursor(last_hit, page['sort_by']))
+
+        yield '], "next": {}}}'.format(json.dumps(next_cursor))
+
+    return Response(stream_page(), mimetype='application/json')
+
+
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 
                            Helper Methods
@@ -205,31 +253,105 @@ def update_user():
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 
 
-@app.route('/downloadTable', methods=['POST'])
-def download_table():
+@app.route('/exportHITs', methods=['GET', 'POST'])
+def export_hits():
+    """
+    Streams HITs as a download, as NDJSON (one JSON object per line) or CSV.
+
+    A POST exports the HITs whose ids are in the comma separated 'hit_ids' form field.
+    Otherwise every HIT matching the sort and filter_<column> URL parameters of /api/hits is exported.
+    URL parameter format = 'ndjson' (default) or 'csv'
+    """
+    if 'username' not in session or not session['is_admin']:
+        return Response(json.dumps({'error': 'You must be logged in as an admin!'}), 401, mimetype='application/json')
+
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return Response(json.dumps({'error': "format must be 'ndjson' or 'csv'!"}), 400, mimetype='application/json')
+
+    try:
+        if request.method == 'POST':
+            hits = hit_db.iter_hits_by_ids([hit_id for hit_id in request.form['hit_ids'].split(',') if hit_id])
+        else:
+            page = get_page_params(request.args)
+            page['limit'] = None
+            del page['after']
+            hits = hit_db.iter_hits(**page)
+        # Run the query now, so a bad parameter is reported before the download starts
+        first_hit = next(hits, None)
+    except (KeyError, ValueError) as e:
+        return Response(json.dumps({'error': e.args[0]}), 400, mimetype='application/json')
+
+    hits = itertools.chain([first_hit], hits) if first_hit is not None else iter([])
+
+    if export_format == 'csv':
+        rows, mimetype = stream_csv(hits), 'text/csv'
+    else:
+        rows, mimetype = ('{}\n'.format(json.dumps(hit)) for hit in hits), 'application/x-ndjson'
+
+    response = Response(rows, mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename=hits.{}'.format(export_format)
+
+    return response
 
-    post_data = request.form['hit_ids']
 
-    hit_ids = post_data.split(',')
-    del hit_ids[-1]
+def stream_csv(hits, rows_per_chunk=100):
+    """
+    Helper generator to turn HIT dicts into CSV, a chunk of rows at a time, header first.
+    """
+    csv_buffer = StringIO()
+    writer = csv.writer(csv_buffer)
+    writer.writerow(export_columns)
 
-    print("\nIn download table....")
-    print("\tHIT IDs: {}".format(hit_ids))
+    for num, hit in enumerate(hits, 1):
+        row = []
 
-    hits = []
+        for column in export_columns:
+            value = hit[column]
+            if column in ('answers', 'variables'):
+                value = json.dumps(value)
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            row.append(value)
 
-    for hit_id in hit_ids:
-        hits.append(hit_db.get_hit_by_id(hit_id))
+        writer.writerow(row)
 
-    if not os.path.exists(flask_dir + 'static' '/UserSavedTables'):
-        os.mkdir(flask_dir + 'static' '/UserSavedTables')
+        if num % rows_per_chunk == 0:
+            yield csv_buffer.getvalue()
+            csv_buffer.seek(0)
+            csv_buffer.truncate()
 
-    fname = 'filtered_hits{}.txt'.format(time.time())
-    filtered_hits = open('{}static/UserSavedTables/{}'.format(flask_dir, fname), 'w')
-    filtered_hits.write(json.dumps(hits))
-    filtered_hits.close()
+    yield csv_buffer.getvalue()
 
-    return 'static/UserSavedTables/{}'.format(fname)
+
+def get_page_params(request_args):
+    """
+    Helper method to turn the URL parameters of /api/hits into the arguments of HITDbHandler.iter_hits.
+    Raises ValueError for a parameter that can not be understood.
+    """
+    filters = {}
+
+    for key, value in request_args.iteritems():
+        if key.startswith('filter_') and value:
+            filters[key[len('filter_'):]] = value
+
+    limit = int(request_args.get('limit', 100))
+    if not 1 <= limit <= 1000:
+        raise ValueError("limit must be between 1 and 1000!")
+
+    after = request_args.get('after')
+    if after:
+        after = json.loads(after)
+        if not isinstance(after, list) or len(after) != 2:
+            raise ValueError("after must be the 'next' cursor of a previous page!")
+
+    return {
+        'filters': filters,
+        'sort_by': request_args.get('sort', 'id'),
+        'descending': request_args.get('desc', 'false').lower() == 'true',
+        'after': after or None,
+        'limit': limit
+    }
 
 
 def verify_login(requested_site, requires_admin):
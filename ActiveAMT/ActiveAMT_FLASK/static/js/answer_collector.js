@@ -1,36 +1,162 @@
 //Function to extract the name and value from each 'collectable' input
-//POSTs this data back to flask as key val pairs, split by ':', separated by ',', as a single string
-//For parsing purposes, name and value are wrapped with forward slashes.
+//POSTs this data back to flask as a JSON object of name to value, in the 'answers_json' field.
+//The hitId, assignmentId and workerId from the HIT page's URL are POSTed along with the answers to identify the HIT.
+//They are not read from inputs of the form, as those would also go to AMT's externalSubmit as part of the answer.
+//
+//The answers are sent in the background (fetch keepalive, or sendBeacon), so the form goes on to AMT straight away.
+//The URL to POST to comes from the data-endpoint attribute of this script's tag.
+//Every submission has a submissionId, and is kept in localStorage until flask confirms it. Unconfirmed submissions
+//are re-sent when the next HIT page loads, and flask ignores the ones it already has by their submissionId.
 
-$('form').submit(function(){
-    var request = new XMLHttpRequest();
-    var method = "POST";
-    var url = 'https://127.0.0.1:5000/getAnswers';
-    var async = false;
-    var answers = [];
-    var params;
+(function(){
+    var script = document.currentScript || $('script[src*="answer_collector.js"]').get(0);
+    var endpoint = (script && script.getAttribute('data-endpoint')) || '/getAnswers';
 
-    var inputs = document.getElementsByClassName('collectable');
+    var queueKey = 'activeamt.pendingAnswers';
+    var maxQueued = 50;
+    var maxAge = 24 * 60 * 60 * 1000;
 
-    if(inputs.length > 1){
+    //AMT opens the HIT page with hitId, assignmentId and workerId in its URL
+    function urlParam(name){
+        var match = new RegExp('[?&]' + name + '=([^&#]*)').exec(window.location.search);
+
+        return match ? decodeURIComponent(match[1].replace(/\+/g, ' ')) : null;
+    }
+
+    function newSubmissionId(){
+        var bytes = new Uint8Array(16);
+        var id = '';
+        var i;
+
+        if(window.crypto && window.crypto.getRandomValues){
+            window.crypto.getRandomValues(bytes);
+        } else {
+            for(i = 0; i < bytes.length; i++){
+                bytes[i] = Math.floor(Math.random() * 256);
+            }
+        }
+
+        for(i = 0; i < bytes.length; i++){
+            id += ('0' + bytes[i].toString(16)).slice(-2);
+        }
+
+        return id;
+    }
+
+    //localStorage can be unavailable (ex. blocked in the AMT iframe), then submissions are just sent once
+    function loadQueue(){
+        try {
+            var queue = JSON.parse(window.localStorage.getItem(queueKey)) || [];
+            var now = new Date().getTime();
+
+            return queue.filter(function(submission){
+                return now - submission.queuedAt < maxAge;
+            });
+        } catch(e) {
+            return [];
+        }
+    }
+
+    function saveQueue(queue){
+        try {
+            window.localStorage.setItem(queueKey, JSON.stringify(queue.slice(-maxQueued)));
+        } catch(e) {}
+    }
+
+    function enqueue(submission){
+        var queue = loadQueue();
+
+        queue.push(submission);
+        saveQueue(queue);
+    }
+
+    function dequeue(submissionId){
+        saveQueue(loadQueue().filter(function(submission){
+            return submission.submissionId !== submissionId;
+        }));
+    }
+
+    function send(submission){
+        var contentType = 'application/x-www-form-urlencoded';
+
+        if(window.fetch){
+            //keepalive lets the request outlive the page, as the form is about to navigate away from it
+            window.fetch(endpoint, {
+                method: 'POST',
+                headers: {'Content-Type': contentType},
+                body: submission.params,
+                credentials: 'same-origin',
+                keepalive: true
+            }).then(function(response){
+                //A 400 would only be refused again, so it is not worth keeping either
+                if(response.ok || response.status == 400){
+                    dequeue(submission.submissionId);
+                }
+            }).catch(function(){});
+        } else if(navigator.sendBeacon){
+            //A beacon is never confirmed, so it stays queued and is re-sent once, harmlessly, on the next page
+            navigator.sendBeacon(endpoint, new Blob([submission.params], {type: contentType}));
+        } else {
+            var request = new XMLHttpRequest();
+
+            request.onload = function(){
+                if(request.status < 300 || request.status == 400){
+                    dequeue(submission.submissionId);
+                }
+            };
+
+            request.open('POST', endpoint, true);
+            request.setRequestHeader('Content-type', contentType);
+            request.send(submission.params);
+        }
+    }
+
+    $('form').submit(function(){
+        var answers = {};
+        var submission = {
+            submissionId: newSubmissionId(),
+            queuedAt: new Date().getTime()
+        };
+
+        var inputs = document.getElementsByClassName('collectable');
         var i;
 
         for(i = 0; i < inputs.length; i++){
-            var name = inputs[i].name;
+            var name = inputs[i].name || 'answer';
             var value = inputs[i].value;
-            var name_val = '/' + name + ':' + value + '/';
 
-            if(name != null && value != null){
-                answers.push(name_val);
+            if(value != null){
+                answers[name] = value;
             }
         }
-        params = "answers=" + answers;
 
-    }else{
-        params = "answers=" + inputs[0].value;
-    }
+        submission.params = "answers_json=" + encodeURIComponent(JSON.stringify(answers));
+        submission.params += "&submissionId=" + submission.submissionId;
+
+        var identity = ['hitId', 'assignmentId', 'workerId'];
+        var j;
+
+        for(j = 0; j < identity.length; j++){
+            var identity_value = urlParam(identity[j]);
+
+            if(identity_value != null){
+                submission.params += '&' + identity[j] + '=' + encodeURIComponent(identity_value);
+            }
+        }
+
+        enqueue(submission);
+        send(submission);
+    });
+
+    //Re-send whatever earlier HIT pages could not get confirmed
+    $(function(){
+        var queue = loadQueue();
+        var k;
 
-    request.open(method, url, async);
-    request.setRequestHeader("Content-type", "application/x-www-form-urlencoded");
-    request.send(params);
-});
\ No newline at end of file
+        saveQueue(queue);
+
+        for(k = 0; k < queue.length; k++){
+            send(queue[k]);
+        }
+    });
+})();
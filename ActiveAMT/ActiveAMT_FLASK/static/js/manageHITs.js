@@ -1,10 +1,19 @@
 
 var app = angular.module('manageHITs', []);
 
-app.controller('manageHITsController', function ($scope) {
+app.controller('manageHITsController', function ($scope, $http, $httpParamSerializer, $timeout) {
 
     //Variable initialization
 
+    //HITs fetched so far, a page at a time, from the server
+    $scope.hits = [];
+    //Cursor of the next page, null once every HIT matching the filters has been fetched
+    $scope.nextCursor = null;
+    $scope.loading = false;
+    var pageSize = 100;
+    //Incremented on every reload, so responses for stale filters/sorting are dropped
+    var reloadCount = 0;
+
     //Initial values for the table sorting
     $scope.sortBy = 'id';
     $scope.sortReverse = false;
@@ -40,6 +49,74 @@ app.controller('manageHITsController', function ($scope) {
 
     //Scope function definitions
 
+    //Builds the /api/hits parameters for the current sorting and filters
+    var pageParams = function(){
+
+        var params = {sort: $scope.sortBy, desc: $scope.sortReverse, limit: pageSize};
+
+        angular.forEach($scope.filterBy, function(value, key){
+            if(value){
+                params[key == '$' ? 'filter_any' : 'filter_' + key] = value;
+            }
+        });
+
+        if($scope.nextCursor){
+            params.after = $scope.nextCursor;
+        }
+
+        return params;
+    };
+
+    //Fetches the next page of HITs from the server, sorted and filtered there
+    $scope.loadPage = function(){
+
+        var thisReload = reloadCount;
+
+        $scope.loading = true;
+
+        $http.get('/api/hits', {params: pageParams()}).then(function(response){
+            if(thisReload != reloadCount) return;
+
+            $scope.hits = $scope.hits.concat(response.data.hits);
+            $scope.nextCursor = response.data.next;
+            $scope.loading = false;
+        }, function(response){
+            if(thisReload != reloadCount) return;
+
+            console.log("Could not load HITs: " + response.status);
+            $scope.loading = false;
+        });
+    };
+
+    //Starts over from the first page, for when the sorting or filters change
+    $scope.reload = function(){
+        reloadCount++;
+        $scope.hits = [];
+        $scope.nextCursor = null;
+        $scope.loadPage();
+    };
+
+    //Function to put on each ng-click of the column headers
+    $scope.sortOn = function(column){
+        $scope.sortReverse = ($scope.sortBy == column) ? !$scope.sortReverse : false;
+        $scope.sortBy = column;
+        $scope.reload();
+    };
+
+    //Re-query once the user stops typing in the filters
+    var filterTimer = null;
+
+    $scope.$watch('filterBy', function(newValue, oldValue){
+
+        if(newValue === oldValue) return;
+
+        if(filterTimer) $timeout.cancel(filterTimer);
+        filterTimer = $timeout($scope.reload, 300);
+
+    }, true);
+
+    $scope.loadPage();
+
     // Helper function to remove an item from the list of clicked attributes
     var del_item = function(item){
 
@@ -171,41 +248,16 @@ app.controller('manageHITsController', function ($scope) {
         return match;
     };
 
-    $scope.downReady = false;
-
-    $scope.downloadTable = function(){
-
-        var request = new XMLHttpRequest();
-        var method = "POST";
-        var url = "/downloadTable";
-        var async = true;
-        var params = "hit_ids=";
+    //Link to download every HIT matching the current sorting and filters, straight from the server
+    $scope.exportUrl = function(format){
 
-        request.open(method, url, async);
+        var params = pageParams();
 
-        request.setRequestHeader("Content-type", "application/x-www-form-urlencoded");
+        delete params.limit;
+        delete params.after;
+        params.format = format;
 
-        request.onreadystatechange =  function () {
-            if(request.readyState == 4 && request.status == 200) {
-                console.log("Download ready...");
-                $scope.downReady = true;
-                $scope.dl_link = request.responseText;
-                $scope.$apply();
-
-            }
-        };
-
-        var i = 0;
-
-        while(i < $scope.filtered_hits.length){
-
-            params += $scope.filtered_hits[i].id + ',';
-
-            i++;
-        }
-
-        request.send(params)
+        return '/exportHITs?' + $httpParamSerializer(params);
+    };
 
-    }
-    
 });
@@ -1,4 +1,4 @@
-from ActiveAMT.Unit_Tests import CLIBTests, DBTests
+from ActiveAMT.Unit_Tests import CLIBTests, DBTests, EventsTests
 
 
 def run_all():
@@ -7,5 +7,6 @@ def run_all():
     """
     DBTests().run_all()
     CLIBTests().run_all()
+    EventsTests().run_all()
 
 run_all()
@@ -1,8 +1,27 @@
 from ActiveAMT.ActiveAMT_CLIB import Clib
-from ActiveAMT.ActiveAMT_DB import hit_db_location
+from ActiveAMT.ActiveAMT_DB import drop_hit_db
+from ActiveAMT.ActiveAMT_FLASK.Custom_Templates import CustomTemplateStore
+from ActiveAMT.ActiveAMT_FLASK.Views.HIT_Views import answers_to_text, parse_answers
+from jinja2 import TemplateNotFound
+from urlparse import parse_qs
 import os
 
 
+def mock_hit_xml(hit_id):
+    """
+    The HIT element AMT sends back for a newly created HIT.
+    """
+    return '<HIT><HITId>{}</HITId><HITTypeId>MOCKHITTYPE</HITTypeId><CreationTime>2017-01-01T00:00:00Z</CreationTime>' \
+           '<Title>Init Test</Title><Description>Testing, testing.</Description><Question>&lt;q/&gt;</Question>' \
+           '<Keywords>Test, Mock</Keywords><HITStatus>Assignable</HITStatus><MaxAssignments>1</MaxAssignments>' \
+           '<Reward><Amount>1.23</Amount><CurrencyCode>USD</CurrencyCode><FormattedPrice>$1.23</FormattedPrice></Reward>' \
+           '<AutoApprovalDelayInSeconds>3600</AutoApprovalDelayInSeconds><Expiration>2017-01-02T00:00:00Z</Expiration>' \
+           '<AssignmentDurationInSeconds>3600</AssignmentDurationInSeconds>' \
+           '<NumberOfAssignmentsPending>0</NumberOfAssignmentsPending>' \
+           '<NumberOfAssignmentsAvailable>1</NumberOfAssignmentsAvailable>' \
+           '<NumberOfAssignmentsCompleted>0</NumberOfAssignmentsCompleted></HIT>'.format(hit_id)
+
+
 class CLIBTests(object):
     """
     Everything necessary to test the functionality of the crowdlib logic.
@@ -42,11 +61,335 @@ class CLIBTests(object):
 
         print("Init HITType - {}".format(passed))
 
+    def stores_html_by_content_correctly(self):
+        """
+        Test if tasks with identical raw HTML share one custom HIT file, named after its content.
+        """
+        passed = "FAIL "
+
+        raw_html = "<p>{{ hit_info['vars']['q1'] }}</p>"
+        first_task = self.clib._handle_html_task({'type': 'html', 'raw': raw_html, 'variables': {'q1': 'One?'}})
+        second_task = self.clib._handle_html_task({'type': 'html', 'raw': raw_html, 'variables': {'q1': 'Two?'}})
+        other_task = self.clib._handle_html_task({'type': 'html', 'raw': raw_html + '<br>'})
+
+        stored_files = set([first_task['html'], other_task['html']])
+
+        if first_task['html'] == second_task['html'] and first_task['html'] != other_task['html'] and \
+           all(os.path.exists(self.clib.custom_hit_path + '/' + fname) for fname in stored_files):
+            passed = "PASS "
+
+        for fname in stored_files:
+            os.remove(self.clib.custom_hit_path + '/' + fname)
+
+        print("Store HTML By Content - {}".format(passed))
+
+    def recovers_existing_hit_correctly(self):
+        """
+        Test if a CreateHIT that AMT already carried out on an earlier try, whose response was lost, returns the
+        HIT that was created instead of failing.
+        """
+        from crowdlib.AMTServer import AMTServer
+
+        passed = "FAIL "
+        hit_id = '3SBNLSTU6U0W2ZA8S0Z3WRBCDOMXZ8'
+
+        responses = [
+            '<CreateHITResponse><HIT><Request><IsValid>False</IsValid><Errors><Error>'
+            '<Code>AWS.MechanicalTurk.HITAlreadyExists</Code>'
+            '<Message>There is already a HIT with the UniqueRequestToken abc123. The HIT ID is {}.</Message>'
+            '</Error></Errors></Request></HIT></CreateHITResponse>'.format(hit_id),
+            '<GetHITResponse>{}</GetHITResponse>'.format(mock_hit_xml(hit_id))
+        ]
+        operations = []
+
+        def mock_post(body):
+            operations.append(parse_qs(body)['Operation'][0])
+            return responses.pop(0)
+
+        server = AMTServer('AKIAMOCK', 'mock secret', 'sandbox')
+        server._server._connection_pool.post = mock_post
+
+        hit_record = server.create_hit('MOCKHITTYPE', '<q/>', 3600, 1, '', 'abc123')
+
+        if hit_record.hit_id == hit_id and operations == ['CreateHIT', 'GetHIT']:
+            passed = "PASS "
+
+        print("Recover Existing HIT - {}".format(passed))
+
+    def keeps_made_hits_on_failure_correctly(self):
+        """
+        Test if the HITs of a partly made chunk are still written to the database when making the next HIT fails.
+        """
+        passed = "FAIL "
+        tasks = [{'type': 'txt', 'question': 'Sequential question {}?'.format(num)} for num in range(5)]
+
+        class MockHIT(object):
+            def __init__(self, hit_id):
+                self.id = hit_id
+
+        class MockHITType(object):
+            def __init__(self):
+                self.created = []
+
+            def create_hit(self, url, height, unique_request_token=None):
+                # The fifth HIT fails, after a full chunk of three and one HIT of the next chunk were made
+                if len(self.created) == 4:
+                    raise UserWarning("Mock failure")
+                self.created.append('SEQUENTIAL_{}'.format(len(self.created)))
+                return MockHIT(self.created[-1])
+
+        hit_type = MockHITType()
+        self.clib._create_hittype = lambda hit_type_init_file=None: hit_type
+
+        try:
+            self.clib.create_hits(tasks, chunk_size=3, num_workers=1)
+            error = None
+        except UserWarning as e:
+            error = e
+        finally:
+            del self.clib._create_hittype
+
+        if error is not None and len(hit_type.created) == 4 and \
+           all(self.clib.db.get_hit_by_id(hit_id) is not None for hit_id in hit_type.created):
+            passed = "PASS "
+
+        print("Keep Made HITs On Failure - {}".format(passed))
+
+    def makes_hits_concurrently_correctly(self):
+        """
+        Test if HITs made from a pool of threads all reach the database in chunks, a failing task doesn't stop
+        the others, and the first error is raised once every task has been tried.
+        """
+        import threading
+
+        passed = "FAIL "
+        tasks = [{'type': 'txt', 'question': 'Concurrent question {}?'.format(num),
+                  'template': 'concurrent_{}.html'.format(num)} for num in range(10)]
+        failing = set(['concurrent_2.html', 'concurrent_7.html'])
+
+        class MockHIT(object):
+            def __init__(self, hit_id):
+                self.id = hit_id
+
+        class MockHITType(object):
+            def __init__(self):
+                self.lock = threading.Lock()
+                self.attempted = []
+
+            def create_hit(self, url, height, unique_request_token=None):
+                template = url.rsplit('/', 1)[-1]
+                with self.lock:
+                    self.attempted.append(template)
+                if template in failing:
+                    raise UserWarning("Mock failure for {}".format(template))
+                return MockHIT('CONCURRENT_' + template.split('.')[0])
+
+        hit_type = MockHITType()
+        chunks = []
+        add_many = self.clib.db.add_many
+
+        def recording_add_many(hits):
+            chunks.append(len(hits))
+            add_many(hits)
+
+        self.clib.db.add_many = recording_add_many
+
+        try:
+            self.clib._make_hits_concurrently(tasks, hit_type, 3, 4)
+            error = None
+        except UserWarning as e:
+            error = e
+        finally:
+            self.clib.db.add_many = add_many
+
+        created_ids = ['CONCURRENT_' + task['template'].split('.')[0] for task in tasks
+                       if task['template'] not in failing]
+
+        if error is not None and str(error).split(' for ')[-1] in failing and \
+           len(hit_type.attempted) == len(tasks) and \
+           sum(chunks) == len(created_ids) and max(chunks) <= 3 and len(chunks) > 1 and \
+           all(self.clib.db.get_hit_by_id(hit_id) is not None for hit_id in created_ids):
+            passed = "PASS "
+
+        print("Make HITs Concurrently - {}".format(passed))
+
+    def stops_making_hits_when_db_fails_correctly(self):
+        """
+        Test if, when a chunk of concurrently made HITs can't be written, the workers stop making HITs and every
+        HIT already made on AMT is still written to the database before the error is raised.
+        """
+        import threading
+        import time
+
+        passed = "FAIL "
+        tasks = [{'type': 'txt', 'question': 'Stopped question {}?'.format(num),
+                  'template': 'stopped_{}.html'.format(num)} for num in range(20)]
+
+        class MockHIT(object):
+            def __init__(self, hit_id):
+                self.id = hit_id
+
+        class MockHITType(object):
+            def __init__(self):
+                self.lock = threading.Lock()
+                self.created = []
+
+            def create_hit(self, url, height, unique_request_token=None):
+                time.sleep(0.02)
+                hit_id = 'STOPPED_' + url.rsplit('/', 1)[-1].split('.')[0]
+                with self.lock:
+                    self.created.append(hit_id)
+                return MockHIT(hit_id)
+
+        hit_type = MockHITType()
+        add_many = self.clib.db.add_many
+        calls = []
+
+        def failing_add_many(hits):
+            # The first chunk fails, as if the database went away for a moment
+            calls.append(len(hits))
+            if len(calls) == 1:
+                raise UserWarning("Mock database failure")
+            add_many(hits)
+
+        self.clib.db.add_many = failing_add_many
+
+        try:
+            self.clib._make_hits_concurrently(tasks, hit_type, 2, 2)
+            error = None
+        except UserWarning as e:
+            error = e
+        finally:
+            self.clib.db.add_many = add_many
+
+        if error is not None and 0 < len(hit_type.created) < len(tasks) and \
+           all(self.clib.db.get_hit_by_id(hit_id) is not None for hit_id in hit_type.created):
+            passed = "PASS "
+
+        print("Stop Making HITs When DB Fails - {}".format(passed))
+
+    def parses_responses_alike_correctly(self):
+        """
+        Test if the iterparse and DOM response parsers make the same records from SearchHITs and
+        GetAssignmentsForHIT responses.
+        """
+        from crowdlib.AMTServer import AMTServer
+        from xml.sax.saxutils import escape
+
+        passed = "FAIL "
+        hit_ids = ['3SBNLSTU6U0W2ZA8S0Z3WRBCDOMXZ0', '3SBNLSTU6U0W2ZA8S0Z3WRBCDOMXZ1']
+
+        answer_xml = escape(
+            '<?xml version="1.0" encoding="UTF-8"?><QuestionFormAnswers xmlns="http://mechanicalturk.amazonaws.com/'
+            'AWSMechanicalTurkDataSchemas/2005-10-01/QuestionFormAnswers.xsd">'
+            '<Answer><QuestionIdentifier>q1</QuestionIdentifier><FreeText>Caf\xc3\xa9 &amp; more</FreeText></Answer>'
+            '<Answer><QuestionIdentifier>q2</QuestionIdentifier><SelectionIdentifier>yes</SelectionIdentifier></Answer>'
+            '</QuestionFormAnswers>')
+        search_response = '<SearchHITsResponse><SearchHITsResult><Request><IsValid>True</IsValid></Request>' \
+                          '<NumResults>2</NumResults><TotalNumResults>2</TotalNumResults><PageNumber>1</PageNumber>' \
+                          '{}</SearchHITsResult></SearchHITsResponse>'.format(''.join(mock_hit_xml(hit_id)
+                                                                                      for hit_id in hit_ids))
+        assignments_response = '<GetAssignmentsForHITResponse><GetAssignmentsForHITResult>' \
+                               '<Request><IsValid>True</IsValid></Request><NumResults>1</NumResults>' \
+                               '<TotalNumResults>1</TotalNumResults><PageNumber>1</PageNumber><Assignment>' \
+                               '<AssignmentId>MOCKASSIGNMENT</AssignmentId><WorkerId>MOCKWORKER</WorkerId>' \
+                               '<HITId>{}</HITId><AssignmentStatus>Submitted</AssignmentStatus>' \
+                               '<AutoApprovalTime>2017-01-08T00:00:00Z</AutoApprovalTime>' \
+                               '<AcceptTime>2017-01-01T00:00:00Z</AcceptTime><SubmitTime>2017-01-01T00:01:00Z</SubmitTime>' \
+                               '<Answer>{}</Answer></Assignment></GetAssignmentsForHITResult>' \
+                               '</GetAssignmentsForHITResponse>'.format(hit_ids[0], answer_xml)
+
+        class MockHIT(object):
+            id = hit_ids[0]
+
+        parsed = {}
+        for response_parser in ('iterparse', 'dom'):
+            responses = [search_response, assignments_response]
+            server = AMTServer('AKIAMOCK', 'mock secret', 'sandbox', response_parser=response_parser)
+            server._server._connection_pool.post = lambda body: responses.pop(0)
+
+            parsed[response_parser] = (list(server.search_hits()), list(server.get_assignments_for_hit(MockHIT())))
+
+        hits, assignments = parsed['iterparse']
+        if parsed['iterparse'] == parsed['dom'] and [hit.hit_id for hit in hits] == hit_ids and \
+           [answer.free_text for answer in assignments[0].answer_records] == [u'Caf\xe9 & more', None]:
+            passed = "PASS "
+
+        print("Parse Responses Alike - {}".format(passed))
+
+    def parses_answers_correctly(self):
+        """
+        Test if the answers posted to /getAnswers are read the same from JSON and from the older '/name:value/'
+        format, and if older free text answers are kept whole, even when they contain a ':'.
+        """
+        passed = "FAIL "
+
+        cases = [
+            ({'answers_json': '{"q1": "Yes", "q2": "a/b"}'}, [('q1', 'Yes'), ('q2', 'a/b')]),
+            ({'answers': '/q1:Yes/,/q2:No/'}, [('q1', 'Yes'), ('q2', 'No')]),
+            ({'answers': '/time:12:30/'}, [('time', '12:30')]),
+            ({'answers': 'A cat'}, [('answer', 'A cat')]),
+            ({'answers': 'Note: cat'}, [('answer', 'Note: cat')]),
+            ({'answers': 'http://i.imgur.com/iY8WB3H.jpg'}, [('answer', 'http://i.imgur.com/iY8WB3H.jpg')])
+        ]
+
+        if all(parse_answers(form).items() == expected for form, expected in cases) and \
+           answers_to_text(parse_answers({'answers': 'Note: cat'})) == 'Note: cat':
+            passed = "PASS "
+
+        print("Parse Answers - {}".format(passed))
+
+    def caches_custom_templates_correctly(self):
+        """
+        Test if custom HIT templates are compiled once, recompiled when their file changes,
+        pre-compiled for the HITs still to be done, and still raise TemplateNotFound for a missing file.
+        """
+        passed = "FAIL "
+
+        store = CustomTemplateStore(self.clib.custom_hit_path)
+        remaining_task = self.clib._handle_html_task({'type': 'html', 'raw': '<p>Remaining</p>'})
+        completed_task = self.clib._handle_html_task({'type': 'html', 'raw': '<p>Completed</p>'})
+        changing_fname = 'template_cache_test.html'
+        changing_path = self.clib.custom_hit_path + '/' + changing_fname
+
+        self.clib._write_html(changing_fname, '<p>Before</p>')
+        first_template = store.get_template(changing_fname)
+        cache_hit_passed = store.get_template(changing_fname) is first_template
+
+        # Push the modification time forward, as a second write within the same second could keep it
+        self.clib._write_html(changing_fname, '<p>After</p>')
+        mtime = os.path.getmtime(changing_path) + 10
+        os.utime(changing_path, (mtime, mtime))
+        changed_template = store.get_template(changing_fname)
+        recompile_passed = changed_template is not first_template and changed_template.render() == '<p>After</p>'
+
+        self.clib.db.add_many([
+            {'id': 'TEMPLATE_CACHE_REMAINING', 'task': dict(remaining_task, template='custom_hit.html'), 'answer': ''},
+            {'id': 'TEMPLATE_CACHE_COMPLETED', 'task': dict(completed_task, template='custom_hit.html'), 'answer': ''}
+        ])
+        self.clib.db.complete_hit('TEMPLATE_CACHE_COMPLETED', 'Done')
+        store.prewarm(self.clib.db.get_remaining_html_files())
+        prewarm_passed = remaining_task['html'] in store._files and completed_task['html'] not in store._files
+
+        try:
+            store.get_template('no_such_custom_hit.html')
+            missing_passed = False
+        except TemplateNotFound:
+            missing_passed = True
+
+        if cache_hit_passed and recompile_passed and prewarm_passed and missing_passed:
+            passed = "PASS "
+
+        for fname in (remaining_task['html'], completed_task['html'], changing_fname):
+            os.remove(self.clib.custom_hit_path + '/' + fname)
+
+        print("Cache Custom Templates - {}".format(passed))
+
     def cleanup(self):
         """
         Method to run after all tests.
         """
-        os.remove(hit_db_location)
+        drop_hit_db()
         print("\nRemoving database...")
 
     def run_all(self):
@@ -55,5 +398,13 @@ class CLIBTests(object):
         """
         self.eqval_evaluates_correctly()
         self.init_hittype_correctly()
+        self.stores_html_by_content_correctly()
+        self.recovers_existing_hit_correctly()
+        self.keeps_made_hits_on_failure_correctly()
+        self.makes_hits_concurrently_correctly()
+        self.stops_making_hits_when_db_fails_correctly()
+        self.parses_responses_alike_correctly()
+        self.parses_answers_correctly()
+        self.caches_custom_templates_correctly()
         self.cleanup()
 
@@ -1,7 +1,9 @@
-# Imported to determine if files are created/destroyed correctly
-import os
+import threading
+
+from sqlalchemy import inspect
 
 from ActiveAMT.ActiveAMT_DB import HITDbHandler
+from ActiveAMT.ActiveAMT_DB import HIT_DB, hit_cache
 
 
 class DBTests(object):
@@ -10,8 +12,8 @@ class DBTests(object):
     """
 
     def __init__(self):
-        if os.path.exists('./hit_database.db'):
-            os.remove('./hit_database.db')
+        # Runs against whichever database ACTIVEAMT_HIT_DB_URL points at, the SQLite file in the CWD by default
+        HIT_DB.drop_db()
         print('\n****Running database tests...\n')
         self.test_db = HITDbHandler()
 
@@ -20,11 +22,46 @@ class DBTests(object):
         Check to see if we can create a HIT database correctly.
         """
 
-        if os.path.exists(self.test_db.db_location):
+        if self.test_db.db_exists():
             print('Database Creation - PASS')
         else:
             print('Database Creation -  Failed')
 
+    def shares_engine_correctly(self):
+        """
+        Check that every handler hands out sessions bound to the same pooled engine.
+        """
+
+        other_db = HITDbHandler()
+
+        first_session = self.test_db.connect_to_db()
+        second_session = other_db.connect_to_db()
+
+        if first_session.get_bind() is second_session.get_bind():
+            print('Shared Engine - PASS')
+        else:
+            print('Shared Engine - FAIL')
+
+        first_session.close()
+        second_session.close()
+
+    def creates_schema_correctly(self):
+        """
+        Check that a new database is stamped with the latest schema version and has its query indexes.
+        """
+
+        engine = HIT_DB.get_engine()
+
+        with engine.begin() as connection:
+            version = HIT_DB._get_schema_version(connection)
+
+        indexed_columns = [index['column_names'] for index in inspect(engine).get_indexes('HITs')]
+
+        if version == HIT_DB.schema_version and ['completed', 'id'] in indexed_columns and ['type'] in indexed_columns:
+            print('Schema Version and Indexes - PASS')
+        else:
+            print('Schema Version and Indexes - FAIL')
+
     def adds_to_db_gets_from_db_correctly(self):
         """
         Check to see if we can add HITs to the HIT database correctly
@@ -68,8 +105,11 @@ class DBTests(object):
             add_to_passed = False
             add_to_reason = "HIT returned from DB is None"
         else:
-            for key in mock_hit.keys():
-                if mock_hit[key] != returned_hit[key]:
+            # HITs come back from the DB flattened, with the task's fields next to the id and answer
+            expected_hit = dict(mock_hit['task'], id=mock_hit['id'], answer=mock_hit['answer'])
+
+            for key in expected_hit.keys():
+                if expected_hit[key] != returned_hit[key]:
                     get_from_passed = False
                     get_from_reason = "Key[{0}] did not match between the mock hit and DB entry".format(key)
                     break
@@ -96,6 +136,59 @@ class DBTests(object):
         else:
             print('Set Answer - FAIL')
 
+    def stores_structured_answers_correctly(self):
+        """
+        Checks that the answers dict given with an answer is stored and returned as is.
+        """
+
+        answers = {'url': 'http://example.com/a:b', 'choice': 'B'}
+        self.test_db.set_answer_for_hit('1234TEST5678', 'Structured answer', answers)
+
+        if self.test_db.get_hit_by_id('1234TEST5678')['answers'] == answers:
+            print('Set Structured Answers - PASS')
+        else:
+            print('Set Structured Answers - FAIL')
+
+    def completes_hit_once_correctly(self):
+        """
+        Checks that of many threads completing the same HIT at once, only the first one stores its answer.
+        """
+
+        self.test_db.add_to_db({
+            'id': 'COMPLETE_ONCE',
+            'task': {
+                'type': 'txt',
+                'question': 'Answered only once?',
+                'template': 'text_hit.html'
+            },
+            'answer': ''
+        })
+
+        results = []
+
+        def complete(num):
+            results.append((num, self.test_db.complete_hit('COMPLETE_ONCE', 'Answer {0}'.format(num))))
+
+        threads = [threading.Thread(target=complete, args=(num,)) for num in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        winners = [num for num, completed in results if completed]
+        hit = self.test_db.get_hit_by_id('COMPLETE_ONCE')
+
+        passed = len(winners) == 1 and hit['completed'] and hit['answer'] == 'Answer {0}'.format(winners[0])
+        passed = passed and not self.test_db.complete_hit('COMPLETE_ONCE', 'Late answer')
+        passed = passed and not self.test_db.complete_hit('NO_SUCH_HIT', 'Lost answer')
+
+        if passed:
+            print('Complete HIT Once - PASS')
+        else:
+            print('Complete HIT Once - FAIL')
+
+        self.test_db.remove_hit_by_id('COMPLETE_ONCE')
+
     def gets_correct_hits_remaining(self):
         """
         Checks to see if we are able to get the correct number of remaining HITs.
@@ -128,22 +221,209 @@ class DBTests(object):
         else:
             print('Remove HIT - FAIL')
 
+    def adds_many_to_db_correctly(self):
+        """
+        Checks that a batch of HITs is added in one transaction, and that a failing batch is rolled back
+        without touching batches added before it.
+        """
+
+        def mock_batch(prefix, size):
+            return [{
+                'id': '{0}{1}'.format(prefix, num),
+                'task': {
+                    'type': 'txt',
+                    'question': 'Batch question {0}?'.format(num),
+                    'template': 'text_hit.html'
+                },
+                'answer': ''
+            } for num in range(size)]
+
+        num_before = len(self.test_db.get_all_hits())
+
+        self.test_db.add_many(mock_batch('BATCH_A', 25))
+
+        added_passed = len(self.test_db.get_all_hits()) == num_before + 25
+
+        # The second batch repeats an id from the first, so the whole second batch must be rolled back
+        bad_batch = mock_batch('BATCH_B', 10) + mock_batch('BATCH_A', 1)
+        try:
+            self.test_db.add_many(bad_batch)
+            rollback_passed = False
+        except Exception:
+            rollback_passed = len(self.test_db.get_all_hits()) == num_before + 25
+
+        if added_passed:
+            print('Add Many HITs - PASS')
+        else:
+            print('Add Many HITs - FAIL')
+
+        if rollback_passed:
+            print('Add Many Rollback - PASS')
+        else:
+            print('Add Many Rollback - FAIL')
+
+    def pages_remaining_hits_correctly(self):
+        """
+        Checks that the remaining HITs can be counted and paged through without loading them all at once.
+        """
+
+        remaining_ids = sorted(hit['id'] for hit in self.test_db.get_remaining_hits())
+        paged_ids = [hit['id'] for hit in self.test_db.iter_remaining_hits(batch_size=7)]
+
+        if self.test_db.count_remaining_hits() == len(remaining_ids):
+            print('Count Remaining HITs - PASS')
+        else:
+            print('Count Remaining HITs - FAIL')
+
+        if paged_ids == remaining_ids:
+            print('Page Remaining HITs - PASS')
+        else:
+            print('Page Remaining HITs - FAIL')
+
+    def caches_hits_correctly(self):
+        """
+        Checks that repeated lookups of a HIT are served from the cache, and that answering the HIT
+        invalidates it.
+        """
+
+        first_lookup = self.test_db.get_hit_by_id('BATCH_A0')
+        first_lookup['question'] = 'Changed by the caller'
+
+        hits_before = hit_cache.get_stats()['hits']
+        second_lookup = self.test_db.get_hit_by_id('BATCH_A0')
+        cache_passed = hit_cache.get_stats()['hits'] == hits_before + 1 and \
+            second_lookup['question'] == 'Batch question 0?'
+
+        self.test_db.set_answer_for_hit('BATCH_A0', 'Cached answer')
+        invalidate_passed = self.test_db.get_hit_by_id('BATCH_A0')['answer'] == 'Cached answer'
+
+        if cache_passed:
+            print('Cache HIT Lookups - PASS')
+        else:
+            print('Cache HIT Lookups - FAIL')
+
+        if invalidate_passed:
+            print('Invalidate Cached HIT - PASS')
+        else:
+            print('Invalidate Cached HIT - FAIL')
+
+    def lists_hits_correctly(self):
+        """
+        Checks that paging through filtered, sorted HITs returns each matching HIT once, in order.
+        """
+
+        filters = {'question': 'batch'}
+        matching_ids = set(hit['id'] for hit in self.test_db.get_all_hits() if 'batch' in hit['question'].lower())
+
+        # The order of the questions is up to the database's collation, so compare the pages with one big page
+        expected = list(self.test_db.iter_hits(filters, 'question', True, limit=None))
+
+        listed = []
+        after = None
+
+        while True:
+            page = list(self.test_db.iter_hits(filters, 'question', True, after, limit=4))
+            listed += page
+
+            if len(page) < 4:
+                break
+
+            after = self.test_db.page_cursor(page[-1], 'question')
+
+        if [hit['id'] for hit in listed] == [hit['id'] for hit in expected] and \
+           set(hit['id'] for hit in expected) == matching_ids:
+            print('List HITs - PASS')
+        else:
+            print('List HITs - FAIL')
+
+    def lists_hits_past_missing_values_correctly(self):
+        """
+        Checks that a page ending on a HIT with a missing (NULL) img_src is followed by the HITs sorting after it.
+        """
+
+        self.test_db.add_many([{
+            'id': 'NULLPAGE{0}'.format(num),
+            'task': {'type': 'img', 'question': 'Null page?', 'img_src': img_src, 'template': 'null_page.html'},
+            'answer': ''
+        } for num, img_src in enumerate(['Missing.jpg', 'Kiwi.jpg', 'Zebra.jpg'])])
+
+        # A legacy row, from before img_src was always filled in
+        session = self.test_db.connect_to_db()
+        session.query(HIT_DB.HIT).filter(HIT_DB.HIT.id == 'NULLPAGE0').update({'img_src': None},
+                                                                              synchronize_session=False)
+        session.commit()
+        session.close()
+        hit_cache.invalidate('NULLPAGE0')
+
+        listed = []
+        after = None
+
+        while True:
+            page = list(self.test_db.iter_hits({'template': 'null_page'}, 'img_src', False, after, limit=1))
+            listed += page
+
+            if not page:
+                break
+
+            after = self.test_db.page_cursor(page[-1], 'img_src')
+
+        if [hit['id'] for hit in listed] == ['NULLPAGE0', 'NULLPAGE1', 'NULLPAGE2'] and listed[0]['img_src'] == '':
+            print('List HITs Past Missing Values - PASS')
+        else:
+            print('List HITs Past Missing Values - FAIL')
+
+    def lists_hits_while_using_db_correctly(self):
+        """
+        Checks that streaming HITs is not cut short by other database calls made on the same thread meanwhile.
+        """
+
+        stream_ids = ['STREAM{0:03}'.format(num) for num in range(250)]
+
+        self.test_db.add_many([{
+            'id': hit_id,
+            'task': {'type': 'txt', 'question': 'Streamed question?', 'template': 'stream.html'},
+            'answer': ''
+        } for hit_id in stream_ids])
+
+        listed = []
+
+        # Longer than one yield_per batch, answering each HIT as it comes, as /api/hits or /exportHITs could
+        for hit in self.test_db.iter_hits({'template': 'stream'}, 'id', False, limit=None):
+            listed.append(hit['id'])
+            self.test_db.set_answer_for_hit(hit['id'], 'Streamed')
+
+        if listed == stream_ids and all(self.test_db.get_hit_by_id(hit_id)['answer'] == 'Streamed'
+                                        for hit_id in stream_ids):
+            print('List HITs While Using DB - PASS')
+        else:
+            print('List HITs While Using DB - FAIL')
+
     def cleanup(self):
         """
         Clean up code to be run at the end of all tests.
         """
         print('\nRemoving database...')
-        os.remove(self.test_db.db_location)
+        HIT_DB.drop_db()
 
     def run_all(self):
         """
         Method to simply run all available database tests in one shot.
         """
         self.creates_db_correctly()
+        self.shares_engine_correctly()
+        self.creates_schema_correctly()
         self.adds_to_db_gets_from_db_correctly()
         self.sets_answer_correctly()
+        self.stores_structured_answers_correctly()
+        self.completes_hit_once_correctly()
         self.gets_correct_hits_remaining()
         self.gets_completed_hits_correctly()
         self.removes_hit_correctly()
+        self.adds_many_to_db_correctly()
+        self.pages_remaining_hits_correctly()
+        self.caches_hits_correctly()
+        self.lists_hits_correctly()
+        self.lists_hits_past_missing_values_correctly()
+        self.lists_hits_while_using_db_correctly()
         self.cleanup()
 
@@ -0,0 +1,164 @@
+import threading
+import time
+
+from ActiveAMT.ActiveAMT_EVENTS.batcher import Batcher
+from ActiveAMT.ActiveAMT_EVENTS.dispatcher import Dispatcher
+from ActiveAMT.ActiveAMT_EVENTS.observable import Observable
+from ActiveAMT.ActiveAMT_EVENTS.observer import Observer
+
+
+class MockObserver(Observer):
+    """
+    Observer that records every event it is updated with, optionally taking its time about it.
+    """
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.events = []
+        self.threads = set()
+
+    def update(self, *args, **kwargs):
+        time.sleep(self.delay)
+        self.events.append(kwargs)
+        self.threads.add(threading.current_thread().name)
+
+
+class EventsTests(object):
+    """
+    Everything necessary to test the delivery of events to observers.
+    """
+
+    def __init__(self):
+        print("\n****Running events tests...")
+        self.observable = Observable()
+
+    def notifies_inline_correctly(self):
+        """
+        Without a dispatcher, observers should be updated before notify_observers returns.
+        """
+        observer = MockObserver()
+        self.observable.register(observer)
+
+        self.observable.notify_observers(completed_task={'hitId': 'INLINE'})
+
+        if observer.events == [{'completed_task': {'hitId': 'INLINE'}}]:
+            print("Inline Notify - PASS")
+        else:
+            print("Inline Notify - FAIL")
+
+        self.observable.unregister(observer)
+
+    def dispatches_in_order_correctly(self):
+        """
+        With a dispatcher, each observer should get every event, in order, always from the same thread.
+        """
+        dispatcher = Dispatcher(num_threads=3)
+        Observable.set_dispatcher(dispatcher)
+
+        observers = [MockObserver() for _ in range(4)]
+        for observer in observers:
+            self.observable.register(observer)
+
+        for num in range(50):
+            self.observable.notify_observers(completed_task={'hitId': num})
+
+        dispatcher.wait_until_idle()
+
+        expected = [{'completed_task': {'hitId': num}} for num in range(50)]
+        passed = all(observer.events == expected and len(observer.threads) == 1 for observer in observers)
+
+        metrics = dispatcher.get_metrics()
+        passed = passed and metrics['dispatched'] == 200 and metrics['delivered'] == 200
+
+        if passed:
+            print("Async Dispatch Ordering - PASS")
+        else:
+            print("Async Dispatch Ordering - FAIL")
+
+        for observer in observers:
+            self.observable.unregister(observer)
+        Observable.set_dispatcher(None)
+        dispatcher.stop()
+
+    def applies_backpressure_correctly(self):
+        """
+        A slow observer with a full queue should make dispatching block, and the block should be counted.
+        """
+        dispatcher = Dispatcher(num_threads=1, max_queue_size=2)
+        Observable.set_dispatcher(dispatcher)
+
+        observer = MockObserver(delay=0.05)
+        self.observable.register(observer)
+
+        for num in range(6):
+            self.observable.notify_observers(completed_task={'hitId': num})
+
+        metrics = dispatcher.get_metrics()
+
+        Observable.set_dispatcher(None)
+        dispatcher.stop()
+
+        if metrics['blocked'] > 0 and metrics['blocked_seconds'] > 0 and len(observer.events) == 6:
+            print("Async Dispatch Backpressure - PASS")
+        else:
+            print("Async Dispatch Backpressure - FAIL")
+
+        self.observable.unregister(observer)
+
+    def batches_by_count_correctly(self):
+        """
+        Completion events should be delivered max_events at a time, with only the latest remaining_tasks.
+        """
+        Observable.set_batcher(Batcher(self.observable.deliver, max_events=5, window_seconds=None))
+
+        observer = MockObserver()
+        self.observable.register(observer)
+
+        for num in range(10):
+            self.observable.notify_observers(remaining_tasks=10 - num, completed_task={'hitId': num})
+
+        expected = [
+            {'completed_tasks': [{'hitId': num} for num in range(5)], 'remaining_tasks': 6},
+            {'completed_tasks': [{'hitId': num} for num in range(5, 10)], 'remaining_tasks': 1}
+        ]
+
+        if observer.events == expected:
+            print("Batch By Count - PASS")
+        else:
+            print("Batch By Count - FAIL")
+
+        Observable.set_batcher(None)
+        self.observable.unregister(observer)
+
+    def batches_by_window_correctly(self):
+        """
+        A batch that never fills up should still be delivered once its window has passed.
+        """
+        Observable.set_batcher(Batcher(self.observable.deliver, max_events=100, window_seconds=0.1))
+
+        observer = MockObserver()
+        self.observable.register(observer)
+
+        for num in range(3):
+            self.observable.notify_observers(completed_task={'hitId': num})
+
+        delivered_early = len(observer.events) > 0
+        time.sleep(0.5)
+
+        if not delivered_early and observer.events == [{'completed_tasks': [{'hitId': num} for num in range(3)]}]:
+            print("Batch By Window - PASS")
+        else:
+            print("Batch By Window - FAIL")
+
+        Observable.set_batcher(None)
+        self.observable.unregister(observer)
+
+    def run_all(self):
+        """
+        Method to simply run all available tests in one shot.
+        """
+        self.notifies_inline_correctly()
+        self.dispatches_in_order_correctly()
+        self.applies_backpressure_correctly()
+        self.batches_by_count_correctly()
+        self.batches_by_window_correctly()
@@ -1,2 +1,3 @@
 from CLIB_Tests import CLIBTests
 from DB_Tests import DBTests
+from EVENTS_Tests import EventsTests
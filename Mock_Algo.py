@@ -194,6 +194,11 @@ class ActiveAlgoObserver(Observer):
         if 'completed_task' in kwargs:
             add_to_db(kwargs['completed_task'])
 
+        # With batching on (actAMT.enable_batching()), completed HITs arrive together
+        if 'completed_tasks' in kwargs:
+            for completed_task in kwargs['completed_tasks']:
+                add_to_db(completed_task)
+
 # Register the observer class with ActiveAMT
 # actAMT.register_observer(ActiveAlgoObserver())
 
@@ -64,12 +64,14 @@ class AMT( object ):
 			self._default_time_limit                 = settings.default_time_limit
 			self._default_qualification_requirements = settings.default_qualification_requirements
 			self._default_keywords                   = settings.default_keywords
+			self._max_connections_per_endpoint       = settings.max_connections_per_endpoint
+			self._response_parser                    = settings.response_parser
 
 			self._html_template = self._get_html_template()
 
 			self._check_settings()
 
-			self._server = AMTServer(self._aws_account_id, self._aws_account_key, self._service_type)
+			self._server = AMTServer(self._aws_account_id, self._aws_account_key, self._service_type, self._max_connections_per_endpoint, self._response_parser)
 
 			self._memory_cache = AMTMemoryCache()
 
@@ -102,6 +104,10 @@ class AMT( object ):
 			raise CrowdLibSettingsError("db_dir must be a directory path.  db_dir==%s"%repr(self._db_dir))
 		if self._service_type not in ("sandbox", "production"):
 			raise CrowdLibSettingsError("service_type must be \"sandbox\" or \"production\".  Got %s"%self._service_type)
+		if not isinstance(self._max_connections_per_endpoint, int) or self._max_connections_per_endpoint < 1:
+			raise CrowdLibSettingsError("max_connections_per_endpoint must be an integer of at least 1.  Got %r"%self._max_connections_per_endpoint)
+		if self._response_parser not in AMTServer.VALID_RESPONSE_PARSERS:
+			raise CrowdLibSettingsError("response_parser must be \"iterparse\" or \"dom\".  Got %r"%self._response_parser)
 
 	def _set_up_db(self):
 		# helper for __init__(..)
@@ -195,9 +201,9 @@ class AMT( object ):
 	def url_for_hit_type_id(self,hit_type_id):
 		return self._server.preview_hit_type_url_stem + hit_type_id
 
-	def create_hit(self, hit_type, question_xml, max_assignments=None, lifetime=None, requester_annotation=None):
-
-		unique_request_token = None # TODO: Implement this for real; not fully implemented as of 12/1/2013
+	def create_hit(self, hit_type, question_xml, max_assignments=None, lifetime=None, requester_annotation=None, unique_request_token=None):
+		# unique_request_token (optional) makes the CreateHIT call idempotent.  AMT will not create a
+		# second HIT for a token it has already seen in the last 24 hours, so retries are safe.
 
 		# Fill in defaults for any parameters that are None
 		if lifetime is None:
@@ -219,10 +225,8 @@ class AMT( object ):
 			unique_request_token = unique_request_token
 		)
 
-		assert hit_record.num_pending==0
-		assert hit_record.num_available==max_assignments
-		assert hit_record.num_completed==0
-		assert hit_record.hit_status==HIT.HIT_STATUS_ASSIGNABLE
+		# If an earlier try created the HIT (see AMTServer.create_hit), workers may have taken it up since.
+		assert hit_record.num_pending + hit_record.num_available + hit_record.num_completed==max_assignments
 		assert hit_record.requester_annotation==requester_annotation
 
 		hit = HIT(
@@ -260,7 +264,7 @@ class AMT( object ):
 
 		return hit
 
-	def create_hit_from_fields(self, fields, hit_type, lifetime, max_assignments, requester_annotation):
+	def create_hit_from_fields(self, fields, hit_type, lifetime, max_assignments, requester_annotation, unique_request_token=None):
 		from crowdlib.QuestionField import AbstractQuestionField, make_text_or_formatted_content_xml
 #		from crowdlib.utility.xml_helpers import looks_like_limited_xhtml
 
@@ -288,11 +292,12 @@ class AMT( object ):
 			question_xml         = question_xml,
 			max_assignments      = max_assignments,
 			lifetime             = lifetime,
-			requester_annotation = requester_annotation
+			requester_annotation = requester_annotation,
+			unique_request_token = unique_request_token
 		)
 		return hit
 
-	def _create_hit_from_url_or_html(self, which, content, frame_height, hit_type, lifetime, max_assignments, requester_annotation):
+	def _create_hit_from_url_or_html(self, which, content, frame_height, hit_type, lifetime, max_assignments, requester_annotation, unique_request_token=None):
 		if which == "url":
 			root_node_name = "ExternalQuestion"
 			namespace = 'http://mechanicalturk.amazonaws.com/AWSMechanicalTurkDataSchemas/2006-07-14/ExternalQuestion.xsd'
@@ -319,7 +324,8 @@ class AMT( object ):
 			question_xml         = question_xml,
 			max_assignments      = max_assignments,
 			lifetime             = lifetime,
-			requester_annotation = requester_annotation
+			requester_annotation = requester_annotation,
+			unique_request_token = unique_request_token
 		)
 		return hit
 
@@ -607,6 +613,7 @@ class AMT( object ):
 
 	def sync_with_amt(self):
 		hit_ids_seen = []
+		hits_to_put = []
 		hit_records_from_db = dict((hr.hit_id, hr) for hr in self._db.get_hit_records())
 
 		for hit_record in self._server.search_hits():
@@ -637,11 +644,16 @@ class AMT( object ):
 				should_update = True
 
 			if should_update: # added this check on 11-13-2013
-				self._db.put_hit(hit)
+				hits_to_put.append(hit)
 
 		known_hit_ids_not_disposed = self._db.get_known_hit_ids_except_hit_status(HIT.HIT_STATUS_DISPOSED)
 		hit_ids_recently_disposed = set(known_hit_ids_not_disposed) - set(hit_ids_seen)
-		self._db.set_hit_statuses(hit_ids_recently_disposed, HIT.HIT_STATUS_DISPOSED)
+
+		# Everything is fetched from AMT by now, so write it all in one commit.
+		with self._db.transaction():
+			for hit in hits_to_put:
+				self._db.put_hit(hit)
+			self._db.set_hit_statuses(hit_ids_recently_disposed, HIT.HIT_STATUS_DISPOSED)
 
 	sync_with_amt_to_update_assignment_counts = sync_with_amt # just an alias to make other code clearer
 
@@ -1036,8 +1048,11 @@ class AMT( object ):
 
 			# 3. Try server.
 			if not seems_up_to_date():
-				for assignment_record in self._server.get_assignments_for_hit(hit=hit):
-					asg = handle_assignment_record(assignment_record=assignment_record, info_from_db=False)
+				# Fetch every page first, then write the assignments and their answers in one commit.
+				assignment_records = list(self._server.get_assignments_for_hit(hit=hit))
+				with self._db.transaction():
+					for assignment_record in assignment_records:
+						asg = handle_assignment_record(assignment_record=assignment_record, info_from_db=False)
 
 				if not seems_up_to_date():
 					if BE_LAZY:
@@ -1106,6 +1121,15 @@ class AMT( object ):
 			)
 			yield bonus
 
+	def get_connection_metrics( self ):
+		return self._server.get_connection_metrics()
+
+	def get_rate_limit_stats( self ):
+		return self._server.get_rate_limit_stats()
+
+	def get_retry_stats( self ):
+		return self._server.get_retry_stats()
+
 	def get_account_balance( self ):
 		account_balance = self._server.get_account_balance()
 		if account_balance.currency_code != self._default_currency:
@@ -0,0 +1,221 @@
+# vim: set fileencoding=utf-8 noexpandtab:
+
+# Created at the University of Maryland, Human-Computer Interaction Lab
+# (c) Copyright 2011 Alexander J. Quinn
+# Licensed under the MIT License (see doc/LICENSE.txt)
+
+'''
+Pool of persistent (keep-alive) HTTPS connections to an AMT service endpoint.
+
+Opening a connection to AMT costs a TCP connect and a TLS handshake, which used to be
+paid again for every request.  The pool keeps up to max_connections of them open and
+hands them out to whichever thread is making a request.
+'''
+
+from __future__ import division, with_statement
+import errno, socket, sys, threading, time
+from crowdlib.all_exceptions import AMTHTTPError, AMTResponseLostError
+
+try:
+	import httplib # Python 2
+except ImportError:
+	import http.client as httplib # Python 3 # [pylint] reimport : pylint:disable=F0401
+
+try:
+	from urlparse import urlsplit # Python 2
+except ImportError:
+	from urllib.parse import urlsplit # Python 3 # [pylint] reimport : pylint:disable=F0401
+
+# Errors sending a request on a reused connection that mean the server had already closed it.
+# The request never reached it, so it is safe to send again on a new connection.
+_STALE_SEND_ERRNOS = (errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED)
+
+class _StaleConnection(Exception):
+	pass
+
+class _ResponseLost(Exception):
+	pass
+
+class AMTConnectionPool(object):
+	# AMT's load balancers drop connections that sit idle for about a minute.  Idle connections
+	# older than this are closed instead of reused, so a request rarely finds a dead one.
+	_MAX_IDLE_SECONDS = 30
+
+	def __init__(self, url, max_connections, timeout=60):
+		assert max_connections >= 1, max_connections
+		parts = urlsplit(url)
+		assert parts.scheme == "https", url
+
+		self._host = parts.hostname
+		self._port = parts.port
+		self._path = parts.path or "/"
+		self._timeout = timeout
+		self.max_connections = max_connections
+
+		# Limits how many connections can be open (idle or in use) at once.  A thread wanting
+		# one when all are in use waits for one to come back.
+		self._slots = threading.BoundedSemaphore(max_connections)
+		self._lock = threading.Lock()
+		self._idle = []  # (connection, time it was returned), most recently returned last
+		self._metrics = {
+			"requests" : 0,
+			"connections_opened" : 0,
+			"connections_reused" : 0,
+			"connections_closed" : 0,
+			"stale_retries" : 0,
+			"errors" : 0,
+			"wait_seconds" : 0.0,
+		}
+
+	def post(self, body, content_type="application/x-www-form-urlencoded"):
+		'''
+		POST body to the endpoint and return the body of the response.
+
+		A connection that was reused and turns out to have been closed by the server before
+		it took the request is replaced and the request sent again, once.  Any other failure,
+		including a timeout, is raised as IOError without sending again, like urlopen(..)
+		would have.  If the request had been sent when it failed, AMT may already have acted
+		on it, and the IOError is an AMTResponseLostError.  An HTTP 5xx status is raised as
+		AMTHTTPError (an IOError).
+		'''
+		if hasattr(body, "encode"):
+			body = body.encode("ascii", "strict")
+		headers = {"Content-Type" : content_type, "Connection" : "keep-alive"}
+
+		wait_start = time.time()
+		self._slots.acquire()
+		try:
+			self._add_to_metric("wait_seconds", time.time() - wait_start)
+			self._add_to_metric("requests", 1)
+
+			conn, is_reused = self._take_connection()
+			try:
+				try:
+					status, reason, data, will_close = self._send(conn, body, headers)
+				except _StaleConnection:
+					if not is_reused:
+						raise
+					self._close_connection(conn)
+					self._add_to_metric("stale_retries", 1)
+					conn = self._open_connection()
+					status, reason, data, will_close = self._send(conn, body, headers)
+			except _ResponseLost:
+				self._close_connection(conn)
+				self._add_to_metric("errors", 1)
+				raise AMTResponseLostError("No response from %s: %s"%(self._host, sys.exc_info()[1]))
+			except (_StaleConnection, socket.error, httplib.HTTPException):
+				self._close_connection(conn)
+				self._add_to_metric("errors", 1)
+				raise IOError("Request to %s failed: %s"%(self._host, _describe_current_exception()))
+
+			if will_close:
+				self._close_connection(conn)
+			else:
+				self._return_connection(conn)
+		finally:
+			self._slots.release()
+
+		if status >= 500:
+			self._add_to_metric("errors", 1)
+			raise AMTHTTPError(status, reason)
+
+		return data
+
+	def get_metrics(self):
+		'''
+		Returns a dict of counters for the pool:
+
+			requests = requests made so far
+			connections_opened = new connections made (each one a TCP connect and TLS handshake)
+			connections_reused = requests sent on an already open connection
+			connections_closed = connections closed, because they failed, went stale, or the server asked
+			stale_retries = requests sent again because a reused connection had been closed by the server
+			errors = requests that failed with IOError
+			wait_seconds = total time spent waiting for a connection while all were in use
+			idle = connections currently open and waiting to be reused
+		'''
+		with self._lock:
+			metrics = dict(self._metrics)
+			metrics["idle"] = len(self._idle)
+		return metrics
+
+	def close(self):
+		'''
+		Close every idle connection.  Connections in use are closed when they come back.
+		'''
+		with self._lock:
+			idle, self._idle = self._idle, []
+		for conn, _ in idle:
+			self._close_connection(conn)
+
+	def _send(self, conn, body, headers):
+		# Raises _StaleConnection only if the server had closed conn before taking the request, and
+		# _ResponseLost for any other failure once the request was sent, since it may have been acted on.
+		try:
+			conn.request("POST", self._path, body, headers)
+		except socket.error:
+			e = sys.exc_info()[1]
+			if not isinstance(e, socket.timeout) and getattr(e, "errno", None) in _STALE_SEND_ERRNOS:
+				raise _StaleConnection("%s: %s"%(e.__class__.__name__, e))
+			raise
+		try:
+			response = conn.getresponse()
+			# The whole body must be read before the connection can carry another request.
+			data = response.read()
+		except httplib.BadStatusLine:
+			e = sys.exc_info()[1]
+			if _is_closed_without_response(e):
+				raise _StaleConnection("%s: %s"%(e.__class__.__name__, e))
+			raise _ResponseLost("%s: %s"%(e.__class__.__name__, e))
+		except (socket.error, httplib.HTTPException):
+			raise _ResponseLost(_describe_current_exception())
+		return response.status, response.reason, data, response.will_close
+
+	def _take_connection(self):
+		now = time.time()
+		stale = []
+		conn = None
+		with self._lock:
+			# The idle list is in the order connections were returned, so the stale ones are at the front.
+			while self._idle and now - self._idle[0][1] > self._MAX_IDLE_SECONDS:
+				stale.append(self._idle.pop(0)[0])
+			# Reuse the most recently returned one, the least likely to have been dropped.
+			if self._idle:
+				conn = self._idle.pop()[0]
+				self._metrics["connections_reused"] += 1
+
+		for candidate in stale:
+			self._close_connection(candidate)
+
+		if conn is not None:
+			return conn, True
+		return self._open_connection(), False
+
+	def _open_connection(self):
+		self._add_to_metric("connections_opened", 1)
+		return httplib.HTTPSConnection(self._host, self._port, timeout=self._timeout)
+
+	def _return_connection(self, conn):
+		with self._lock:
+			self._idle.append((conn, time.time()))
+
+	def _close_connection(self, conn):
+		self._add_to_metric("connections_closed", 1)
+		try:
+			conn.close()
+		except Exception: # [pylint] closing is best effort : pylint:disable=W0703
+			pass
+
+	def _add_to_metric(self, name, amount):
+		with self._lock:
+			self._metrics[name] += amount
+
+def _is_closed_without_response(e):
+	# A BadStatusLine for an empty status line (RemoteDisconnected in Python 3) means the
+	# server closed the connection without sending a byte back.  Other ones mean it answered, badly.
+	line = getattr(e, "line", None)
+	return not line or line == "''" or "has closed the connection" in line
+
+def _describe_current_exception():
+	e = sys.exc_info()[1]
+	return "%s: %s"%(e.__class__.__name__, e)
@@ -10,13 +10,13 @@
 @since: January 2010
 '''
 
-# FIXME: The use of always_commit probably breaks any use of transactions.  Also, we
-#        have no way to ensure all transactions are properly committed. (11-17-2013)
+# FIXME: We have no way to ensure all writes outside of a transaction() block are
+#        properly committed when always_commit is off. (11-17-2013)
 
 # TODO:  Store custom QualificationType info locally. (12/3/2013)
 
 from __future__ import division, with_statement
-import os, os.path, datetime, sqlite3, datetime, threading, collections
+import os, os.path, sys, datetime, sqlite3, datetime, threading, collections, contextlib
 from crowdlib.utility import format_datetime_to_iso_utc, is_string, is_collection_of_strings, is_unicode, literal_eval, log, namedtuple, now_iso_utc, parse_iso_utc_to_datetime_local, total_seconds
 
 try:
@@ -29,6 +29,18 @@ DATABASE_ERROR_BASE_CLASS = sqlite3.Error
 _DBG_PRINT_QUERY_ON_ERROR = False
 _UNDEFINED = object()
 
+# Run on every new connection (see AMTDB._set_up_connection).  WAL lets other threads keep
+# reading while a sync is writing, and with synchronous=NORMAL a commit only waits on the
+# WAL file instead of the whole database.  cache_size is negative to mean KiB, not pages.
+_BUSY_TIMEOUT_MS = 30000
+_CONNECTION_PRAGMAS = (
+	"journal_mode=WAL",
+	"synchronous=NORMAL",
+	"mmap_size=%d"%(256 * 1024 * 1024),
+	"cache_size=%d"%(-64 * 1024),
+	"busy_timeout=%d"%_BUSY_TIMEOUT_MS,
+)
+
 
 class AMTDB( object ):
 	'''
@@ -84,11 +96,17 @@ class AMTDB( object ):
 			conn = thread_local_data.connection
 			self._log("AMTDB._get_connection() : [R] Reused connection for thread %r."%current_thread_ident)
 		except AttributeError:
-			conn = sqlite3.connect(self._filename, detect_types=sqlite3.PARSE_DECLTYPES) # >= 11/17/2013
+			conn = sqlite3.connect(self._filename, detect_types=sqlite3.PARSE_DECLTYPES, # >= 11/17/2013
+			                       timeout=_BUSY_TIMEOUT_MS / 1000)
+			self._set_up_connection(conn)
 			thread_local_data.connection = conn
 			conn.row_factory = sqlite3.Row
 			self._log("AMTDB._get_connection() : [C] Created connection for thread %r."%current_thread_ident)
 		return conn
+
+	def _set_up_connection(self, conn):
+		for pragma in _CONNECTION_PRAGMAS:
+			conn.execute("pragma " + pragma + ";")
 	
 	def __init__(self, filename, verbose=False, always_commit=False):
 		self._filename = filename
@@ -149,6 +167,35 @@ class AMTDB( object ):
 		conn = self._get_connection()
 		conn.commit()
 		self._log( "Did DB commit" )
+
+	@contextlib.contextmanager
+	def transaction(self):
+		'''
+		Group every write this thread makes inside the with block into a single commit,
+		even when always_commit is on.  Rolls them all back if the block raises.  Nested
+		blocks are part of the outermost one.
+
+		Only database calls belong inside.  The write lock is held from the first write
+		until the commit, so requests to the AMT server should be made before entering.
+		'''
+		thread_local_data = self.__class__._thread_local_data # [pylint] access private member : pylint:disable=W0212
+		depth = getattr(thread_local_data, "transaction_depth", 0)
+		thread_local_data.transaction_depth = depth + 1
+		try:
+			yield self
+		except:
+			thread_local_data.transaction_depth = depth
+			if depth == 0:
+				self._get_connection().rollback()
+				self._log( "Rolled back DB transaction" )
+			raise
+		thread_local_data.transaction_depth = depth
+		if depth == 0:
+			self.commit()
+
+	def _is_in_transaction(self):
+		thread_local_data = self.__class__._thread_local_data # [pylint] access private member : pylint:disable=W0212
+		return getattr(thread_local_data, "transaction_depth", 0) > 0
 	
 	def query(self, sql, *params):
 		# Do a raw SQL query against the SQLite database.  This is primarily used internally
@@ -202,8 +249,8 @@ class AMTDB( object ):
 				raise
 			break
 
-		# Commit after every non-SELECT query iff always_commit==True
-		if self.always_commit and not sql.lower().lstrip().startswith("select"):
+		# Commit after every non-SELECT query iff always_commit==True, unless a transaction() will
+		if self.always_commit and not self._is_in_transaction() and not sql.lower().lstrip().startswith("select"):
 			self.commit()
 
 		return cursor
@@ -0,0 +1,122 @@
+# vim: set fileencoding=utf-8 noexpandtab:
+
+# Created at the University of Maryland, Human-Computer Interaction Lab
+# (c) Copyright 2011 Alexander J. Quinn
+# Licensed under the MIT License (see doc/LICENSE.txt)
+
+'''
+Client-side rate limit for requests to AMT, shared by every thread using a connection.
+
+It is a token bucket whose rate adapts to AMT's throttling (AIMD):  each throttled request
+halves the rate, and each successful one raises it a little, back up to the configured
+maximum.  Threads queue up for their turn, so together they send at the allowed rate
+instead of bursting past it and getting throttled into long retry delays.
+'''
+
+from __future__ import division, with_statement
+import threading, time
+
+class AMTRateLimiter(object):
+
+	def __init__(self, max_rate, burst=None, min_rate=0.1, decrease_factor=0.5, increase_per_second=None):
+		# max_rate (float) : requests per second the rate starts at and never exceeds
+		# burst (float) : requests that can be sent at once after a quiet period (default: 1 second's worth, at least 1)
+		# min_rate (float) : requests per second the rate never goes below
+		# decrease_factor (float) : what the rate is multiplied by when AMT throttles a request
+		# increase_per_second (float) : how much the rate recovers per second of successful requests (default: 5% of max_rate)
+		assert max_rate > 0 and 0 < min_rate <= max_rate, (max_rate, min_rate)
+		assert 0 < decrease_factor < 1, decrease_factor
+
+		self.max_rate = float(max_rate)
+		self.min_rate = float(min_rate)
+		self.burst = float(burst) if burst is not None else max(1.0, self.max_rate)
+		self.decrease_factor = decrease_factor
+		self.increase_per_second = increase_per_second if increase_per_second is not None else self.max_rate * 0.05
+
+		self._lock = threading.Lock()
+		self._rate = self.max_rate
+		self._tokens = self.burst   # goes negative while requests are queued up waiting for tokens
+		self._last_refill_time = time.time()
+		self._last_decrease_time = None
+		self._num_waiting = 0
+		self._stats = {
+			"requests" : 0,
+			"throttled" : 0,
+			"waited" : 0,
+			"wait_seconds" : 0.0,
+		}
+
+	def acquire(self):
+		'''
+		Block until this thread may send a request.  Threads are let through in the order they called.
+		'''
+		with self._lock:
+			self._refill()
+			self._tokens -= 1
+			self._stats["requests"] += 1
+			# A negative balance is the tokens already promised to the threads ahead of this one.
+			wait_seconds = -self._tokens / self._rate if self._tokens < 0 else 0
+			if wait_seconds > 0:
+				self._num_waiting += 1
+				self._stats["waited"] += 1
+				self._stats["wait_seconds"] += wait_seconds
+
+		if wait_seconds > 0:
+			time.sleep(wait_seconds)
+			with self._lock:
+				self._num_waiting -= 1
+
+	def on_success(self):
+		'''
+		Call after AMT accepted a request.  Raises the rate towards max_rate (additive increase).
+		'''
+		with self._lock:
+			if self._rate < self.max_rate:
+				self._refill()
+				# Spread the increase over the requests of one second, whatever the current rate is.
+				self._rate = min(self.max_rate, self._rate + self.increase_per_second / self._rate)
+
+	def on_throttled(self):
+		'''
+		Call after AMT throttled a request.  Cuts the rate (multiplicative decrease).  Throttled
+		responses to requests that were already on their way count as one.
+		'''
+		with self._lock:
+			now = time.time()
+			self._stats["throttled"] += 1
+			if self._last_decrease_time is not None and now - self._last_decrease_time < 1 / self._rate:
+				return
+			self._refill()
+			self._last_decrease_time = now
+			self._rate = max(self.min_rate, self._rate * self.decrease_factor)
+			# Don't let a burst built up at the old rate go out at once.
+			self._tokens = min(self._tokens, 1.0)
+
+	@property
+	def rate(self):
+		with self._lock:
+			return self._rate
+
+	@property
+	def queue_depth(self):
+		with self._lock:
+			return self._num_waiting
+
+	def get_stats(self):
+		'''
+		Returns a dict with the current rate (requests per second), the queue depth (threads
+		waiting for their turn), and counters of requests, throttled requests, requests that had
+		to wait, and the total time they were made to wait.
+		'''
+		with self._lock:
+			stats = dict(self._stats)
+			stats["rate"] = self._rate
+			stats["max_rate"] = self.max_rate
+			stats["queue_depth"] = self._num_waiting
+		return stats
+
+	def _refill(self):
+		# Must be called with the lock held.
+		now = time.time()
+		self._tokens = min(self.burst, self._tokens + (now - self._last_refill_time) * self._rate)
+		self._last_refill_time = now
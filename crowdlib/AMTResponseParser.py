@@ -0,0 +1,226 @@
+# vim: set fileencoding=utf-8 noexpandtab:
+
+# Created at the University of Maryland, Human-Computer Interaction Lab
+# (c) Copyright 2011 Alexander J. Quinn
+# Licensed under the MIT License (see doc/LICENSE.txt)
+
+'''
+Incremental (iterparse) parsing of AMT responses straight into HITRecord, AssignmentRecord
+and AnswerRecord objects.
+
+A SearchHITs page of 100 HITs with their Question XML makes a large DOM with xml.dom.minidom,
+and nothing ever unlinks it.  Here each HIT or Assignment element is turned into its record
+as soon as its end tag is read, then cleared, so only one of them is held in memory at a time.
+
+The DOM-based extraction in AMTServer is still there, and used when
+crowdlib.settings.response_parser is "dom".
+'''
+
+from __future__ import division, with_statement
+from io import BytesIO
+from crowdlib.AnswerRecord import AnswerRecord
+from crowdlib.AssignmentRecord import AssignmentRecord
+from crowdlib.HITRecord import HITRecord
+from crowdlib.QualificationRequirementRecord import QualificationRequirementRecord
+from crowdlib.Reward import Reward
+from crowdlib.utility import is_string, parse_iso_utc_to_datetime_local, to_boolean, to_duration, to_unicode
+
+try:
+	from xml.etree.cElementTree import iterparse # Python 2
+except ImportError:
+	from xml.etree.ElementTree import iterparse # Python 3 # [pylint] reimport : pylint:disable=F0401
+
+# Children of a HIT element:  child name => (HITRecord field, function to convert the text, or None)
+HIT_FIELDS = {
+	"HITId": ("hit_id", None),
+	"HITTypeId": ("hit_type_id", None),
+	"CreationTime": ("creation_time", parse_iso_utc_to_datetime_local),
+	"Title": ("title", None),
+	"Description": ("description", None),
+	"Question": ("question", None),
+	"Keywords": ("keywords", lambda content:tuple(kw.strip() for kw in content.split(","))),
+	"HITStatus": ("hit_status", None),
+	"MaxAssignments": ("max_assignments", int),
+	"AutoApprovalDelayInSeconds": ("auto_approval_delay", to_duration),
+	"Expiration": ("expiration_time", parse_iso_utc_to_datetime_local),
+	"AssignmentDurationInSeconds": ("assignment_duration", to_duration),
+	"NumberOfSimilarHITs": ("number_of_similar_hits", int),
+	"HITReviewStatus": ("hit_review_status", None),
+	"RequesterAnnotation": ("requester_annotation", None),
+	"NumberOfAssignmentsPending": ("num_pending", int),
+	"NumberOfAssignmentsAvailable": ("num_available", int),
+	"NumberOfAssignmentsCompleted": ("num_completed", int),
+}
+
+# Children of a HIT element that are not kept
+HIT_IGNORED_CHILDREN = ("Request", "HITGroupId", "HITLayoutId")
+
+def iterparse_records(xml, record_tag, extract_fn, info_tags=()):
+	'''
+	Parse an AMT response incrementally.
+
+	Returns a list of extract_fn(element) for each record_tag element, in document order, and a dict
+	with the text of each element named in info_tags that is not inside one of them (i.e., "TotalNumResults").
+	'''
+	if not isinstance(xml, bytes):
+		xml = xml.encode("utf8")
+
+	records = []
+	info = {}
+	depth = 0  # record_tag elements we are inside of
+	for event, element in iterparse(BytesIO(xml), events=("start", "end")):
+		tag = _local_name(element.tag)
+		if tag == record_tag:
+			if event == "start":
+				depth += 1
+			else:
+				depth -= 1
+				if depth == 0:
+					records.append(extract_fn(element))
+					element.clear()
+		elif event == "end" and depth == 0 and tag in info_tags:
+			info[tag] = _text(element)
+	return records, info
+
+def extract_hit_element(hit_element):
+	# Element counterpart of AMTServer._extract_hit_node(..)
+	kwargs = {}
+	kwargs["qualification_requirements"] = []
+	kwargs["hit_review_status"] = None
+	kwargs["number_of_similar_hits"] = None
+	kwargs["requester_annotation"] = ""
+
+	for child in hit_element:
+		child_name = _local_name(child.tag)
+
+		if child_name=="Reward":
+			kwargs["reward"] = _extract_reward_element(child)
+		elif child_name=="QualificationRequirement" and len(child)>1:
+			kwargs["qualification_requirements"].append(_extract_qualification_requirement_element(child))
+		elif child_name in HIT_IGNORED_CHILDREN:
+			pass
+		else:
+			key,prepper_fn = HIT_FIELDS[child_name] # KeyError here would indicate unexpected info in HIT structure
+			content = _text(child)
+			if prepper_fn is not None:
+				content = prepper_fn(content)
+			kwargs[key] = content
+
+	kwargs = dict((str(k),v) for (k,v) in kwargs.items())
+	return HITRecord(**kwargs)
+
+def extract_assignment_element(assignment_element):
+	# Element counterpart of AMTServer._extract_assignment_data(..)
+	autopay_time = rejection_time = submit_time = approval_time = None
+
+	answer_xml = None
+	answer_records = ()
+	requester_feedback = None
+	for child in assignment_element:
+		name = _local_name(child.tag)
+		if name=="AssignmentId":
+			assignment_id = _text(child)
+		elif name=="WorkerId":
+			worker_id = _text(child)
+			assert is_string(worker_id)
+		elif name=="HITId":
+			hit_id = _text(child)
+		elif name=="AssignmentStatus":
+			assignment_status = _text(child)
+		elif name=="AutoApprovalTime":
+			autopay_time = parse_iso_utc_to_datetime_local(_text(child))
+		elif name=="SubmitTime":
+			submit_time = parse_iso_utc_to_datetime_local(_text(child))
+		elif name=="ApprovalTime":
+			approval_time = parse_iso_utc_to_datetime_local(_text(child))
+		elif name=="AcceptTime":
+			accept_time = parse_iso_utc_to_datetime_local(_text(child))
+		elif name=="RejectionTime":
+			rejection_time = parse_iso_utc_to_datetime_local(_text(child))
+		elif name=="RequesterFeedback":
+			requester_feedback = _text(child)
+		elif name=="Answer":
+			assert answer_xml is None, "Only expected one Answer node per Assignment node"
+			answer_xml = _text(child)
+			answer_records = tuple(iterparse_records(answer_xml, "Answer", extract_answer_element)[0])
+
+	return AssignmentRecord(
+			accept_time=accept_time,
+			answer_records=answer_records,
+			approval_time=approval_time,
+			assignment_id=assignment_id,
+			assignment_status=assignment_status,
+			auto_approval_time=autopay_time,
+			hit_id=hit_id,
+			rejection_time=rejection_time,
+			requester_feedback=requester_feedback,
+			submit_time=submit_time,
+			worker_id=worker_id)
+
+def extract_answer_element(answer_element):
+	# Element counterpart of AMTServer._extract_answer_from_dom_node(..)
+	free_text = uploaded_file_key = uploaded_file_size_in_bytes = selection_identifier = other_selection = None
+
+	for child in answer_element:
+		name = _local_name(child.tag)
+		if name=="QuestionIdentifier":
+			question_identifier = _text(child)
+		elif name=="FreeText":
+			free_text = _text(child)
+		elif name=="SelectionIdentifier":
+			selection_identifier = _text(child)
+		elif name=="OtherSelection":
+			other_selection = _text(child)
+		elif name=="UploadedFileKey":
+			uploaded_file_key = _text(child)
+		elif name=="UploadedFileSizeInBytes":
+			uploaded_file_size_in_bytes = int(_text(child))
+		else:
+			assert False, "Unexpected node type found: %s"%name
+
+	return AnswerRecord(
+			question_identifier=question_identifier,
+			free_text=free_text,
+			selection_identifier=selection_identifier,
+			other_selection=other_selection,
+			uploaded_file_key=uploaded_file_key,
+			uploaded_file_size_in_bytes=uploaded_file_size_in_bytes)
+
+def _extract_reward_element(reward_element):
+	reward_info = {}
+	for child in reward_element:
+		child_name = _local_name(child.tag)
+		assert child_name in ("Amount","CurrencyCode","FormattedPrice")
+		reward_info[child_name] = _text(child)
+
+	return Reward(
+			amount=reward_info["Amount"],
+			currency_code=reward_info["CurrencyCode"],
+			formatted_price=reward_info["FormattedPrice"])
+
+def _extract_qualification_requirement_element(qreq_element):
+	qreq_info = {}
+	for child in qreq_element:
+		child_name = _local_name(child.tag)
+		if child_name=="LocaleValue":
+			country_element = child[0]
+			assert _local_name(country_element.tag)=="Country"
+			qreq_info["LocaleValue"] = _text(country_element)
+		else:
+			# Common case
+			qreq_info[child_name] = _text(child)
+
+	return QualificationRequirementRecord(
+			qualification_type_id=qreq_info["QualificationTypeId"],
+			comparator=qreq_info["Comparator"],
+			integer_value=qreq_info.get("IntegerValue",None),
+			locale_value=qreq_info.get("LocaleValue",None),
+			required_to_preview=to_boolean(qreq_info["RequiredToPreview"]))
+
+def _text(element):
+	# Same as text_node_content(..) gives for the DOM node:  the stripped text, as unicode.
+	return to_unicode((element.text or "").strip())
+
+def _local_name(tag):
+	# "{namespace}Answer" => "Answer"
+	return tag.rsplit("}", 1)[-1]
@@ -0,0 +1,209 @@
+# vim: set fileencoding=utf-8 noexpandtab:
+
+# Created at the University of Maryland, Human-Computer Interaction Lab
+# (c) Copyright 2011 Alexander J. Quinn
+# Licensed under the MIT License (see doc/LICENSE.txt)
+
+'''
+Decides whether, and when, a failed request to AMT is sent again.
+
+- Only failures that may go away on their own are retried:  throttling, network errors,
+  HTTP 5xx statuses and AMT's internal errors.  Anything else (a bad parameter, an unknown
+  HIT, ...) would fail again the same way, so it is raised right away.  A request whose
+  response was lost may have been acted on, so it is only sent again if doing so is safe:
+  it only reads (Get.., Search..) or carries a UniqueRequestToken.
+- Retries wait an exponentially growing, randomly jittered delay, so clients that failed
+  together don't all come back at the same moment.
+- Each operation gets a budget of retries per time window, so a flood of failures can't
+  turn into a flood of retries eating the request rate.
+- After enough failures in a row, the circuit breaker opens and requests fail straight
+  away with AMTCircuitOpenError instead of each one waiting through its retries.  After
+  reset_timeout, one request is let through to see if AMT is back.
+'''
+
+from __future__ import division, with_statement
+import collections, random, threading, time
+from crowdlib.all_exceptions import AMTCircuitOpenError, AMTHTTPError, AMTRequestFailed, AMTResponseLostError
+
+# AMT error codes meaning the request was fine but AMT couldn't take it just then.
+_THROTTLED_CODES = frozenset(("ServiceUnavailable", "AWS.ServiceUnavailable"))
+_TRANSIENT_CODES = frozenset(("InternalError", "AWS.InternalError", "ServiceFailure", "AWS.ServiceFailure"))
+
+class AMTRetryPolicy(object):
+	THROTTLED = "throttled"  # AMT is up but we are sending too fast.  The rate limiter paces the retry.
+	TRANSIENT = "transient"  # AMT or the network failed.  The retry waits out a backoff delay.
+
+	_CLOSED, _OPEN, _HALF_OPEN = "closed", "open", "half-open"
+
+	def __init__(self, max_attempts=8, base_delay=1.0, max_delay=60*5, multiplier=2.0,
+					budget_window=60, budget_ratio=0.2, budget_min_retries=10,
+					failure_threshold=5, reset_timeout=30):
+		# max_attempts (int) : attempts per request, including the first one
+		# base_delay, max_delay (float) : seconds; the n'th retry waits a random time up to min(max_delay, base_delay * multiplier**(n-1))
+		# budget_window (float) : seconds over which an operation's requests and retries are counted
+		# budget_ratio, budget_min_retries : an operation may retry budget_min_retries + budget_ratio * (its requests) times per window
+		# failure_threshold (int) : failures in a row (not counting throttling) that open the circuit
+		# reset_timeout (float) : seconds the circuit stays open before a request is let through to test it
+		assert max_attempts >= 1, max_attempts
+		assert 0 < base_delay <= max_delay and multiplier >= 1, (base_delay, max_delay, multiplier)
+		assert failure_threshold >= 1, failure_threshold
+
+		self.max_attempts = max_attempts
+		self.base_delay = base_delay
+		self.max_delay = max_delay
+		self.multiplier = multiplier
+		self.budget_window = budget_window
+		self.budget_ratio = budget_ratio
+		self.budget_min_retries = budget_min_retries
+		self.failure_threshold = failure_threshold
+		self.reset_timeout = reset_timeout
+
+		self._lock = threading.Lock()
+		self._requests = collections.defaultdict(collections.deque)  # operation => times of requests in the window
+		self._retries = collections.defaultdict(collections.deque)   # operation => times of retries in the window
+		self._state = self._CLOSED
+		self._consecutive_failures = 0
+		self._opened_time = None
+		self._probe_time = None
+		self._stats = {
+			"retries" : 0,
+			"throttled" : 0,
+			"failures" : 0,
+			"out_of_budget" : 0,
+			"out_of_attempts" : 0,
+			"circuit_opened" : 0,
+			"rejected" : 0,
+		}
+
+	def classify(self, e, operation=None, parameters=None):
+		'''
+		Returns THROTTLED or TRANSIENT if the request that raised e is worth sending again, or None if not.
+		'''
+		if isinstance(e, AMTResponseLostError) and not _is_safe_to_resend(operation, parameters):
+			return None
+		elif isinstance(e, AMTRequestFailed):
+			if e.code in _THROTTLED_CODES:
+				return self.THROTTLED
+			elif e.code in _TRANSIENT_CODES:
+				return self.TRANSIENT
+			else:
+				return None
+		elif isinstance(e, AMTHTTPError) and e.status == 503:
+			return self.THROTTLED
+		elif isinstance(e, IOError):   # network error or other HTTP 5xx
+			return self.TRANSIENT
+		else:
+			return None
+
+	def before_attempt(self, operation):
+		'''
+		Call before every attempt.  Raises AMTCircuitOpenError if the circuit is open.
+		'''
+		with self._lock:
+			now = time.time()
+			if self._state == self._CLOSED:
+				return
+			if self._state == self._OPEN and now - self._opened_time >= self.reset_timeout:
+				self._state = self._HALF_OPEN
+				self._probe_time = None
+			if self._state == self._HALF_OPEN:
+				# Let a single request through to test AMT.  If it never reports back, let another one go later.
+				if self._probe_time is None or now - self._probe_time >= self.reset_timeout:
+					self._probe_time = now
+					return
+				retry_after = self._probe_time + self.reset_timeout - now
+			else:
+				retry_after = self._opened_time + self.reset_timeout - now
+			self._stats["rejected"] += 1
+		raise AMTCircuitOpenError(operation, retry_after)
+
+	def on_request(self, operation):
+		'''
+		Call once per request, before its first attempt.  Requests count towards the operation's retry budget.
+		'''
+		with self._lock:
+			now = time.time()
+			requests = self._requests[operation]
+			requests.append(now)
+			self._prune(requests, now)
+
+	def on_success(self):
+		'''
+		Call when AMT answered, even if with an error that won't be retried.  AMT is up, so this closes the circuit.
+		'''
+		with self._lock:
+			self._consecutive_failures = 0
+			self._state = self._CLOSED
+			self._probe_time = None
+
+	def on_failure(self, kind):
+		'''
+		Call when an attempt failed with a retryable error (kind is what classify(..) returned).
+		'''
+		with self._lock:
+			if kind == self.THROTTLED:
+				# Being throttled means AMT is up, so this counts as a success for the circuit.
+				# Slowing down is the rate limiter's business.
+				self._stats["throttled"] += 1
+				self._consecutive_failures = 0
+				if self._state == self._HALF_OPEN:
+					self._state = self._CLOSED
+					self._probe_time = None
+				return
+			self._stats["failures"] += 1
+			self._consecutive_failures += 1
+			if self._state == self._HALF_OPEN or (self._state == self._CLOSED
+					and self._consecutive_failures >= self.failure_threshold):
+				self._state = self._OPEN
+				self._opened_time = time.time()
+				self._stats["circuit_opened"] += 1
+
+	def allow_retry(self, operation, attempt):
+		'''
+		Returns True if a request that has failed attempt times may be sent again, and counts the retry.
+		'''
+		with self._lock:
+			if attempt >= self.max_attempts:
+				self._stats["out_of_attempts"] += 1
+				return False
+			now = time.time()
+			requests = self._prune(self._requests[operation], now)
+			retries = self._prune(self._retries[operation], now)
+			if len(retries) >= self.budget_min_retries + self.budget_ratio * len(requests):
+				self._stats["out_of_budget"] += 1
+				return False
+			retries.append(now)
+			self._stats["retries"] += 1
+			return True
+
+	def get_delay(self, attempt):
+		'''
+		Returns how many seconds to wait before sending a request again after its attempt'th failure.
+		'''
+		# "Full jitter":  anywhere from 0 to the exponential backoff, so retries spread out evenly.
+		ceiling = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+		return random.uniform(0, ceiling)
+
+	def get_stats(self):
+		'''
+		Returns a dict with the circuit's state and counters of retries, throttled and failed attempts,
+		requests that gave up (out of budget or attempts), times the circuit opened, and requests it rejected.
+		'''
+		with self._lock:
+			stats = dict(self._stats)
+			stats["circuit_state"] = self._state
+			stats["consecutive_failures"] = self._consecutive_failures
+		return stats
+
+	def _prune(self, times, now):
+		# Must be called with the lock held.
+		while times and now - times[0] > self.budget_window:
+			times.popleft()
+		return times
+
+def _is_safe_to_resend(operation, parameters):
+	# Sending these twice does no harm.  Anything else (ApproveAssignment, GrantBonus, ExtendHIT, ...)
+	# could pay or extend twice if the first one went through.
+	if operation is not None and operation.startswith(("Get", "Search")):
+		return True
+	return bool(parameters and parameters.get("UniqueRequestToken"))
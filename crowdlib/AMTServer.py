@@ -9,8 +9,13 @@
 @contact: aq@purdue.edu
 @since: November 2010
 '''
-import datetime, sys
+import datetime, re, sys, threading
+try:
+	import Queue as queue # Python 2
+except ImportError:
+	import queue # Python 3 # [pylint] reimport : pylint:disable=F0401
 from crowdlib.all_exceptions import AMTRequestFailed, AssignmentAlreadyFinalizedException, XMLProcessingException
+from crowdlib.AMTResponseParser import HIT_FIELDS, HIT_IGNORED_CHILDREN, extract_assignment_element, extract_hit_element, iterparse_records
 from crowdlib.AMTServerConnection import AMTServerConnection
 from crowdlib.AnswerRecord import AnswerRecord
 from crowdlib.AssignmentRecord import AssignmentRecord
@@ -19,7 +24,10 @@ from crowdlib.QualificationRequirement import QualificationRequirement
 from crowdlib.QualificationRequirementRecord import QualificationRequirementRecord
 from crowdlib.QualificationType import QualificationType
 from crowdlib.Reward import Reward
-from crowdlib.utility import bool_in_element, datetime_in_element, duration_in_element, is_number, is_sequence_of, is_sequence_of_strings, is_string, number_in_element, parse_iso_utc_to_datetime_local, text_in_element, text_node_content, to_boolean, to_duration, to_tuple_if_non_sequence_iterable, to_unicode, total_seconds, xml2dom, xml_in_element
+from crowdlib.utility import bool_in_element, datetime_in_element, duration_in_element, is_number, is_sequence_of, is_sequence_of_strings, is_string, number_in_element, parse_iso_utc_to_datetime_local, text_in_element, text_node_content, to_boolean, to_tuple_if_non_sequence_iterable, to_unicode, total_seconds, xml2dom, xml_in_element
+
+# What AMT HIT IDs look like, i.e. "3SBNLSTU6U0W2ZA8S0Z3WRBCDOMXZ8"
+_HIT_ID_PATTERN = re.compile(r"\b[A-Z0-9]{30}\b")
 
 class AMTServer(object):
 	SERVICE_TYPE_SANDBOX    = "sandbox"
@@ -32,18 +40,49 @@ class AMTServer(object):
 		"sandbox":"http://workersandbox.mturk.com/mturk/preview?groupId="
 	}
 
-	def __init__( self, aws_account_id, aws_account_key, service_type):
+	RESPONSE_PARSER_ITERPARSE = "iterparse"
+	RESPONSE_PARSER_DOM       = "dom"
+	VALID_RESPONSE_PARSERS    = (RESPONSE_PARSER_ITERPARSE, RESPONSE_PARSER_DOM)
+
+	def __init__( self, aws_account_id, aws_account_key, service_type, max_connections=10, response_parser="iterparse"):
 		assert service_type in self.VALID_SERVICE_TYPES
-		self._server = AMTServerConnection(aws_account_id, aws_account_key, service_type)
+		assert response_parser in self.VALID_RESPONSE_PARSERS, response_parser
+		self._server = AMTServerConnection(aws_account_id, aws_account_key, service_type, max_connections)
+		self._max_connections = max_connections
 		self._service_type = service_type
+		self._response_parser = response_parser
 
 	@property
 	def preview_hit_type_url_stem(self):
 		return self._PREVIEW_HIT_TYPE_URL_STEMS[self._service_type]
 
+	def get_connection_metrics(self):
+		return self._server.get_connection_metrics()
+
+	def get_rate_limit_stats(self):
+		return self._server.get_rate_limit_stats()
+
+	def get_retry_stats(self):
+		return self._server.get_retry_stats()
+
 	def do_request( self, operation, specific_parameters):
 		return self._server.do_request(operation, specific_parameters)
 
+	def _request_records(self, operation, params, record_tag, info_tags=()):
+		# Run a request and return the records made from its record_tag ("HIT" or "Assignment") elements,
+		# and a dict with the text of its info_tags elements.
+		if self._response_parser == self.RESPONSE_PARSER_ITERPARSE:
+			extract_fn = {"HIT":extract_hit_element, "Assignment":extract_assignment_element}[record_tag]
+			xml = self._server.do_request_xml(operation, params)
+			return iterparse_records(xml, record_tag, extract_fn, info_tags)
+		else:
+			extract_fn = {"HIT":self._extract_hit_node, "Assignment":self._extract_assignment_data}[record_tag]
+			dom = self._server.do_request(operation, params)
+			records = [extract_fn(node) for node in dom.getElementsByTagName(record_tag)]
+			info = dict((tag, text_in_element(dom, tag)) for tag in info_tags)
+			dom.unlink()
+			return records, info
+
 	def grant_bonus(self, assignment_id, worker_id, amount, currency, reason):
 		params = {
 			"AssignmentId":assignment_id,
@@ -76,12 +115,20 @@ class AMTServer(object):
 
 			kwargs["UniqueRequestToken"] = unique_request_token
 
-		dom = self._server.do_request( "CreateHIT", kwargs)
-		hit_nodes = dom.getElementsByTagName("HIT")
-		assert len(hit_nodes)==1
-		hit_node = hit_nodes[0]
-		result = self._extract_hit_node(hit_node=hit_node)
-		return result
+		try:
+			hit_records, _ = self._request_records("CreateHIT", kwargs, "HIT")
+		except AMTRequestFailed:
+			e = sys.exc_info()[1]
+			if "UniqueRequestToken" not in kwargs or not e.code.endswith("HITAlreadyExists"):
+				raise
+			# An earlier try with this token created the HIT, but its response was lost before it got back
+			# to us.  That HIT is the one that was asked for, so return it rather than failing.
+			hit_ids = [s for s in _HIT_ID_PATTERN.findall(e.msg) if s != unique_request_token]
+			if not hit_ids:
+				raise
+			return self.get_hit(hit_ids[0])
+		assert len(hit_records)==1
+		return hit_records[0]
 
 	def register_hit_type(self, title, description, reward, currency, time_limit, keywords, autopay_delay,
 						qualification_requirements):
@@ -123,9 +170,77 @@ class AMTServer(object):
 		return hit_type_id
 
 
-	def search_hits(self):
-		page_num = 0
+	def search_hits(self, num_threads=None): # GENERATOR
+		'''
+		Yields a HITRecord for every HIT, in the order SearchHITs pages through them.
+
+		The first page gives the total number of HITs.  The remaining pages are then fetched
+		num_threads at a time (by default, one per connection to AMT), each request still
+		subject to the connection's rate limit.  Pages are fetched at most a few ahead of the
+		one being yielded from, so memory stays bounded however many HITs there are.
+		'''
 		page_size = 100
+		if num_threads is None:
+			num_threads = self._max_connections
+
+		hit_records, total_num_results = self._search_hits_page(1, page_size)
+		for hit_record in hit_records:
+			yield hit_record
+
+		num_pages = (total_num_results + page_size - 1) // page_size
+		if num_pages <= 1:
+			return
+
+		page_nums = range(2, num_pages + 1)
+		num_threads = max(1, min(num_threads, len(page_nums)))
+		max_pages_ahead = num_threads * 2
+		request_queue = queue.Queue()  # (page number, Queue to put its (hit_records, exception) in)
+		results_by_page_num = {}
+		stop_event = threading.Event()
+
+		def fetch_pages():
+			while True:
+				request = request_queue.get()
+				if request is None or stop_event.is_set():
+					return
+				page_num, result_queue = request
+				try:
+					result = (self._search_hits_page(page_num, page_size)[0], None)
+				except Exception: # [pylint] passed on to the consuming thread : pylint:disable=W0703
+					result = (None, sys.exc_info()[1])
+				result_queue.put(result)
+
+		def request_page(page_num):
+			results_by_page_num[page_num] = queue.Queue(1)
+			request_queue.put((page_num, results_by_page_num[page_num]))
+
+		threads = []
+		for _ in range(num_threads):
+			thread = threading.Thread(target=fetch_pages)
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+
+		try:
+			for page_num in page_nums[:max_pages_ahead]:
+				request_page(page_num)
+
+			for i, page_num in enumerate(page_nums):
+				hit_records, e = results_by_page_num.pop(page_num).get()
+				if e is not None:
+					raise e
+				if i + max_pages_ahead < len(page_nums):
+					request_page(page_nums[i + max_pages_ahead])
+				for hit_record in hit_records:
+					yield hit_record
+		finally:
+			# Also reached if the caller stops iterating early.  Threads finish the page they are on.
+			stop_event.set()
+			for _ in threads:
+				request_queue.put(None)
+
+	def _search_hits_page(self, page_num, page_size):
+		# Returns the HITRecords on one page of SearchHITs (1-based), and the total number of HITs.
 		request_params =  {
 				"PageSize":page_size,
 				"SortProperty":"Enumeration",
@@ -135,25 +250,14 @@ class AMTServer(object):
 				"ResponseGroup.2":"Minimal",
 				"ResponseGroup.3":"HITAssignmentSummary"
 		}
-		results = []
-		while True:
-			page_num += 1
-			request_params["PageNumber"] = page_num
-			dom = self._server.do_request("SearchHITs", request_params)
-
-			total_num_results = int(text_in_element(dom,"TotalNumResults"))
-			observed_page_num = int(text_in_element(dom,"PageNumber"))
-			if page_num != observed_page_num:
-				raise XMLProcessingException("Reported page number doesn't match expected")
+		hit_records, info = self._request_records("SearchHITs", request_params, "HIT", ("TotalNumResults", "PageNumber"))
 
-			hit_nodes = dom.getElementsByTagName("HIT")
-			for hit_node in hit_nodes:
-				result = self._extract_hit_node(hit_node=hit_node)
-				results.append(result)
+		total_num_results = int(info["TotalNumResults"])
+		observed_page_num = int(info["PageNumber"])
+		if page_num != observed_page_num:
+			raise XMLProcessingException("Reported page number doesn't match expected")
 
-			if total_num_results <= page_num*page_size:
-				break
-		return results
+		return hit_records, total_num_results
 	
 	def get_hit(self, hit_id):
 		params = {
@@ -163,12 +267,9 @@ class AMTServer(object):
 			"ResponseGroup.2":"Minimal",
 			"ResponseGroup.3":"HITAssignmentSummary"
 		}
-		dom = self._server.do_request( "GetHIT", params)
-		hit_nodes = dom.getElementsByTagName("HIT")
-		assert len(hit_nodes)==1
-		hit_node = hit_nodes[0]
-		result = self._extract_hit_node(hit_node=hit_node)
-		return result
+		hit_records, _ = self._request_records("GetHIT", params, "HIT")
+		assert len(hit_records)==1
+		return hit_records[0]
 
 	def get_reviewable_hit_ids(self, hit_type_id=None): # GENERATOR
 		page_num = 0
@@ -258,26 +359,6 @@ class AMTServer(object):
 		kwargs["number_of_similar_hits"] = None
 		kwargs["requester_annotation"] = ""
 
-		keys_preppers_by_child_name = {
-			"HITId": ("hit_id", None),
-			"HITTypeId": ("hit_type_id", None),
-			"CreationTime": ("creation_time", parse_iso_utc_to_datetime_local),
-			"Title": ("title", None),
-			"Description": ("description", None),
-			"Question": ("question", None),
-			"Keywords": ("keywords", lambda content:tuple(kw.strip() for kw in content.split(","))),
-			"HITStatus": ("hit_status", None),
-			"MaxAssignments": ("max_assignments", int),
-			"AutoApprovalDelayInSeconds": ("auto_approval_delay", to_duration),
-			"Expiration": ("expiration_time", parse_iso_utc_to_datetime_local),
-			"AssignmentDurationInSeconds": ("assignment_duration", to_duration),
-			"NumberOfSimilarHITs": ("number_of_similar_hits", int),
-			"HITReviewStatus": ("hit_review_status", None),
-			"RequesterAnnotation": ("requester_annotation", None),
-			"NumberOfAssignmentsPending": ("num_pending", int),
-			"NumberOfAssignmentsAvailable": ("num_available", int),
-			"NumberOfAssignmentsCompleted": ("num_completed", int),
-		}
 		for child in hit_node.childNodes:
 			child_name = child.nodeName
 
@@ -286,12 +367,10 @@ class AMTServer(object):
 			elif child_name=="QualificationRequirement" and len(child.childNodes)>1:
 				qreq = self._extract_qualification_requirement_node(child)
 				kwargs["qualification_requirements"].append(qreq)
-			elif child_name=="Request":
-				pass # Ignore this one.
-			elif child_name in ("HITGroupId", "HITLayoutId"):
-				pass # not supported, ignore for now
+			elif child_name in HIT_IGNORED_CHILDREN:
+				pass # Request, and others not supported for now
 			else:
-				key,prepper_fn = keys_preppers_by_child_name[child_name] # KeyError here would indicate unexpected info in HIT structure
+				key,prepper_fn = HIT_FIELDS[child_name] # KeyError here would indicate unexpected info in HIT structure
 				content = text_node_content(child)
 				if prepper_fn is not None:
 					content = prepper_fn(content)
@@ -444,9 +523,8 @@ class AMTServer(object):
 		self._server.do_request("NotifyWorkers", params)
 
 	def get_assignments_for_hit(self, hit):  # GENERATOR
-		dom = self._server.do_request( "GetAssignmentsForHIT", {"HITId":hit.id, "PageSize":100, "PageNumber":1} )
-		for assignment_node in dom.getElementsByTagName( "Assignment" ):
-			assignment_record = self._extract_assignment_data( assignment_node=assignment_node )
+		assignment_records, _ = self._request_records("GetAssignmentsForHIT", {"HITId":hit.id, "PageSize":100, "PageNumber":1}, "Assignment")
+		for assignment_record in assignment_records:
 			assert hit.id==assignment_record.hit_id, "Expected them to be the same: "%(repr((hit.id,assignment_record.hit_id)))
 			yield assignment_record
 
@@ -632,65 +710,6 @@ class AMTServer(object):
 
 
 
-#vvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvv
-# EXPERIEMENTAL CODE (do not delete, yet)
-#
-
-#	TODO:  Make search_hits multi-threaded.  Below is a start on doing that.
-#
-#	There are some options.  I'm not sure which is best, easiest, or even possible/functional:
-#	  * worker threads
-#	  * asynchttp module
-#	  * pycurl
-#	  * eventlets / greenlets
-#	  * concurrent futures
-#
-#	The advantage of threads is that it would pose no serious Python 2/3 or platform issues.  However,
-#	someone said in this StackOverflow discussion that threads may not solve the problem.
-#	http://stackoverflow.com/questions/4962808/asynchronous-http-calls-in-python#comment21544074_4963126
-#
-#	def search_hits(self):
-#		# Strategy:  Use a queue and worker threads.
-#
-#		# MULTI-THREADED
-#		from crowdlib.all_exceptions import XMLProcessingException
-#		from crowdlib.utility import text_in_element, dmp_xml
-#		from math import ceil
-#		page_num = 0
-#		page_size = 100
-#		request_params =  {"PageSize":page_size, "SortProperty":"Enumeration", "PageNumber":page_num, "ResponseGroup.0":"HITDetail", "ResponseGroup.1":"HITQuestion","ResponseGroup.2":"Minimal","ResponseGroup.3":"HITAssignmentSummary"}
-#		hits_seen = 0
-#		hit_type_dict = {}
-#
-#		# Page number is 1-based.
-#		# http://docs.amazonwebservices.com/AWSMechTurk/2008-08-02/AWSMturkAPI/ApiReference_SearchHITsOperation.html
-#
-#		first_page_num = 1
-#		request_params["PageNumber"] = first_page_num
-#		operation = "SearchHITs"
-#		dom = self._server.do_request(operation, request_params)
-#		doms = [dom]
-##			num_results = int(text_in_element(dom, "NumResults"))
-#		total_num_results = int(text_in_element(dom,"TotalNumResults"))
-##			observed_page_num = int(text_in_element(dom,"PageNumber"))
-##			if page_num != observed_page_num:
-##				raise XMLProcessingException("Reported page number doesn't match expected")
-#		num_pages = int(ceil(total_num_results / page_size))	
-#		operation_specific_parameters_pairs = []
-#		for page_num in range(first_page_num + 1, first_page_num + num_pages):
-#			request_params = request_params.copy()
-#			request_params["PageNumber"] = page_num
-#			operation_specific_parameters_pairs.append((operation, request_params))
-#
-#		doms += self._server.do_requests_simultaneously(operation_specific_parameters_pairs=operation_specific_parameters_pairs)
-#		for dom in doms:
-#			hit_nodes = dom.getElementsByTagName("HIT")
-#			for hit_node in hit_nodes:
-#				result = self._extract_hit_node(hit_node=hit_node)
-#				yield result
-	
-
-
 #vvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvv
 # SHRAPNEL (delete any time if you don't think it will be needed)
 #
@@ -13,7 +13,10 @@
 from __future__ import division, with_statement
 import codecs, hmac, os, pprint, sys, time, traceback
 from crowdlib.all_exceptions import AMTQualificationTypeAlreadyExists, AMTRequestFailed
-from crowdlib.utility import base64_encodestring_py23_compatible, clear_line, get_call_stack_strs, log, urlencode_py23_compatible, urlopen_py23_compatible, xml2dom
+from crowdlib.AMTConnectionPool import AMTConnectionPool
+from crowdlib.AMTRateLimiter import AMTRateLimiter
+from crowdlib.AMTRetryPolicy import AMTRetryPolicy
+from crowdlib.utility import base64_encodestring_py23_compatible, clear_line, get_call_stack_strs, log, urlencode_py23_compatible, xml2dom
 from crowdlib.utility.debugging import is_debugging
 from crowdlib.utility.time_utils import now_local
 from hashlib import sha1 as sha
@@ -43,7 +46,8 @@ class AMTServerConnection(object):
 
 	def __init__( self, aws_account_id,
 						aws_account_key,
-						service_type):
+						service_type,
+						max_connections=10):
 
 		assert service_type in self.VALID_SERVICE_TYPES
 
@@ -54,11 +58,38 @@ class AMTServerConnection(object):
 		self._max_requests_per_second = {"sandbox":5, "production":100}[service_type]
 		self._url = self._SERVICE_URLS[service_type] # URL for submitting requests to AMT
 		self._last_request_time = None  # for dealing with AMT throttling
+		self._connection_pool = AMTConnectionPool(self._url, max_connections)  # keep-alive connections to _url
+
+		# Every request from every thread using this connection waits its turn here.  The rate
+		# backs off when AMT throttles us and recovers up to _max_requests_per_second.
+		self._rate_limiter = AMTRateLimiter(self._max_requests_per_second)
+
+		# Which failures are retried and when, shared by all threads so that the circuit breaker
+		# and retry budgets see every request.  Can be replaced to tune it.
+		self.retry_policy = AMTRetryPolicy()
 
 	@property
 	def preview_hit_type_url_stem(self):
 		return self._PREVIEW_HIT_TYPE_URL_STEMS[self._service_type]
 
+	def get_connection_metrics(self):
+		'''
+		Returns a dict of counters for the connections to AMT (see AMTConnectionPool.get_metrics).
+		'''
+		return self._connection_pool.get_metrics()
+
+	def get_rate_limit_stats(self):
+		'''
+		Returns a dict with the current request rate and queue depth (see AMTRateLimiter.get_stats).
+		'''
+		return self._rate_limiter.get_stats()
+
+	def get_retry_stats(self):
+		'''
+		Returns a dict with the circuit breaker's state and retry counters (see AMTRetryPolicy.get_stats).
+		'''
+		return self.retry_policy.get_stats()
+
 	def _generate_timestamp(self,gmtime):
 		#return  '2010-06-13T04:04:49Z'
 		return time.strftime("%Y-%m-%dT%H:%M:%SZ", gmtime)
@@ -88,7 +119,17 @@ class AMTServerConnection(object):
 
 		Returns (DOM object) : AMT's response as a DOM object created by the xml.dom.minidom module
 
-		Note:  This does not currently deal with disposing of the DOM objects.
+		Note:  The caller owns the DOM object and should unlink() it when done.  AMTServer's
+		HIT and Assignment listings don't come through here unless response_parser is "dom",
+		and then they unlink it; only the callers of this method that use the DOM directly
+		are left holding one.
+		'''
+		return xml2dom(self.do_request_xml(operation, specific_parameters))
+
+	def do_request_xml( self, operation, specific_parameters):
+		'''
+		Run an AWS request, like do_request(..), but return AMT's response as the XML it came as
+		(bytes), for parsing some other way.  Errors in the response are raised just the same.
 		'''
 
 		_verbose = VERBOSE or is_debugging()
@@ -99,17 +140,19 @@ class AMTServerConnection(object):
 
 		self._last_request_time = time.time()
 
-		# Parameters for quick retry (in case of throttling or minor network issues)
-		query_retry_delay = 1.0 # seconds, also subject to exponential backoff (delay **= 1.5 each time)
-		query_retry_delay_backoff_exponent = 1.5
-		query_retry_delay_max = 60*5 # Don't stall longer than 15 minutes
-		query_retry_count = int(60*60*24 / query_retry_delay_max)  # Give up after 24 hours.
+		# Retry in case of throttling or minor server and network issues, as the retry policy allows.
+		retry_policy = self.retry_policy
+		retry_policy.on_request(operation)
 
 		if DEBUG_LOG_REQUESTS_TO_FILE:
 			formatted_traceback_if_exception = None
 
 		# Start trying.  Normally, it will succeed on the first try... we hope.  :)
-		for try_counter in range( query_retry_count ):
+		attempt = 0
+		while True:
+			attempt += 1
+			retry_policy.before_attempt(operation)  # raises AMTCircuitOpenError if AMT has been failing
+			self._rate_limiter.acquire()
 			try:
 				result_xml = None
 				errors_nodes = None
@@ -128,10 +171,12 @@ class AMTServerConnection(object):
 
 				# Make the request
 				encoded_parameters = urlencode_py23_compatible(parameters)
-				result_xml = urlopen_py23_compatible(self._url, encoded_parameters).read()
-				result_dom = xml2dom(result_xml)
+				result_xml = self._connection_pool.post(encoded_parameters)
 
-				errors_nodes = result_dom.getElementsByTagName('Errors')
+				# Only build a DOM to look for errors if there could be any.  Question and Answer XML
+				# inside a response is escaped, so it can't produce a false <Errors> here.
+				if b"<Errors>" in result_xml:
+					errors_nodes = xml2dom(result_xml).getElementsByTagName('Errors')
 				if errors_nodes:
 					for errors_node in errors_nodes:
 						for error_node in errors_node.getElementsByTagName('Error'):
@@ -142,31 +187,31 @@ class AMTServerConnection(object):
 							else:
 								raise AMTRequestFailed( code=code, msg=msg, operation=operation, query_params=specific_parameters )
 				else:
+					self._rate_limiter.on_success()
+					retry_policy.on_success()
 					break
 			except Exception:     # [pylint] blanket exception handler, will re-raise if not handled : pylint:disable=W0703
 				e = sys.exc_info()[1]
 				if DEBUG_LOG_REQUESTS_TO_FILE:
 					formatted_traceback_if_exception = traceback.format_exc().splitlines()
 
-				if isinstance(e, AMTRequestFailed):
-					if not (operation=="ForceExpireHIT" and code.endswith("InvalidHITState")):
-						pass
-					if code in ("ServiceUnavailable", "AWS.ServiceUnavailable"):
-						self._max_requests_per_second = max(0.01, self._max_requests_per_second-0.1)
-					else:
-						# Don't retry unknown AMT exceptions.
-						raise e
-				elif isinstance(e, IOError):
-					pass
-				elif try_counter+1 >= query_retry_count:
+				retry_kind = retry_policy.classify(e, operation, specific_parameters)
+				if retry_kind is None:
+					if isinstance(e, AMTRequestFailed):
+						retry_policy.on_success()  # AMT answered, so it's up even if it didn't like the request
+					# Don't retry errors that would only happen again.
 					raise e
-				else:
-					#import traceback
-					#traceback.print_exc()
+
+				retry_policy.on_failure(retry_kind)
+				if retry_kind == AMTRetryPolicy.THROTTLED:
+					# Slow down.  The rate limiter paces the retry along with every other request, so no extra delay.
+					self._rate_limiter.on_throttled()
+
+				if not retry_policy.allow_retry(operation, attempt):
 					raise e
-				time.sleep( query_retry_delay )
-				query_retry_delay = query_retry_delay ** query_retry_delay_backoff_exponent
-				query_retry_delay = min(query_retry_delay, query_retry_delay_max)
+
+				if retry_kind == AMTRetryPolicy.TRANSIENT:
+					time.sleep(retry_policy.get_delay(attempt))
 
 				if DEBUG_LOG_REQUESTS_TO_FILE:
 					formatted_traceback_if_exception = None  #If we get this far, then it was handled and need not be logged after all.
@@ -185,7 +230,7 @@ class AMTServerConnection(object):
 			#msg = msg + "\n".join("\n - %s"%s for s in reversed(call_stack_strs))
 			log(msg)
 
-		return result_dom
+		return result_xml
 
 	def _write_to_request_log_file(self, operation, specific_parameters, call_stack_strs, formatted_traceback_if_exception):
 		now = now_local()
@@ -215,70 +260,10 @@ class AMTServerConnection(object):
 			log_file.write(s)
 
 
-#vvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvv
-# EXPERIEMENTAL CODE (do not delete, yet)
-#
-
-#	def do_requests_simultaneously( self, operation_specific_parameters_pairs ):
-#
-#		# Only do threading in production mode.  Sandbox doesn't like heavy load.
-#
-#		doms = []
-#		if self._service_type==self.SERVICE_TYPE_PRODUCTION and False:
-#			try:
-#				# Python 2
-#				from Queue import Queue, Empty
-#			except ImportError:
-#				# Python 3
-#				from queue import Queue, Empty
-#			import threading
-#			num_worker_threads = 4
-#
-#			# Create a thread-safe queue and populate with the requests.
-#			inputs = Queue()
-#			results = Queue()
-#
-#			def worker():
-#				operation,specific_parameters = inputs.get()
-#				dom = self.do_request(operation=operation, specific_parameters=specific_parameters)
-#				results.put(dom)
-#				q.task_done()
-#
-#			for operation,specific_parameters in operation_specific_parameters_pairs:
-#				inputs.put((operation,specific_parameters))
-#
-#			for i in range(num_worker_threads):
-#				t = threading.Thread(target=worker)
-#				t.daemon = True
-#				t.start()
-#
-#			inputs.join()
-#			try:
-#				while True:
-#					dom = results.get()
-#					doms.append(dom)
-#			except Empty:
-#				pass
-#		else:
-#			for operation,specific_parameters in operation_specific_parameters_pairs:
-#				dom = self.do_request(operation=operation, specific_parameters=specific_parameters)
-#				doms.append(dom)
-#		return doms
-
-
 #vvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvv
 # SHRAPNEL (delete any time if you don't think it will be needed)
 #
 
-# ## taken from do_request() .. near top
-#		# Rate limiting, but only in sandbox
-#		if self._service_type == self.SERVICE_TYPE_SANDBOX:
-#			if self._last_request_time is not None:
-#				seconds_since_last_request = time.time()-self._last_request_time
-#				required_interval = 1.0 / self._max_requests_per_second
-#				if seconds_since_last_request < required_interval:
-#					time.sleep( max( 0.01, required_interval - seconds_since_last_request ) )
-
 #def get_call_stack_strs(clip_most_recent=0, include_only_paths_starting_with=None):
 #	import inspect, os, sys
 #	parts = []
@@ -43,6 +43,14 @@ class CrowdLibSettings(object):
 		self.default_qualification_requirements = () # Default:  none
 		self.default_keywords = ()
 
+		# Keep-alive HTTPS connections kept open to the AMT endpoint, shared by all threads.
+		# Should be at least the number of threads making requests at once.
+		self.max_connections_per_endpoint = 10
+
+		# How AMT's responses are turned into records:  "iterparse" reads them incrementally, one
+		# HIT or assignment at a time.  "dom" builds a whole xml.dom.minidom DOM first, as before.
+		self.response_parser = "iterparse"
+
 	# CrowdLibSettings is a SINGLETON class
 	#
 	# Credit: "jojo" on StackOverflow, 11/27/2009
@@ -225,17 +225,18 @@ class HITType( object ):
 
 
 
-	def _create_hit_from_url(self, url, height, lifetime=None, max_assignments=None, requester_annotation=None):
+	def _create_hit_from_url(self, url, height, lifetime=None, max_assignments=None, requester_annotation=None, unique_request_token=None):
 		hit = self._amt.create_hit_from_url(
 							url=url,
 							frame_height=height,
 							hit_type=self,
 							lifetime=lifetime,
 							max_assignments=max_assignments,
-							requester_annotation=requester_annotation)
+							requester_annotation=requester_annotation,
+							unique_request_token=unique_request_token)
 		return hit
 
-	def _create_hit_from_body(self, body, height, onload="", style="", max_assignments=None, lifetime=None, requester_annotation=None):
+	def _create_hit_from_body(self, body, height, onload="", style="", max_assignments=None, lifetime=None, requester_annotation=None, unique_request_token=None):
 		hit = self._amt.create_hit_from_html_parts(
 							body=body,
 							onload=onload,
@@ -244,34 +245,37 @@ class HITType( object ):
 							hit_type=self,
 							lifetime=lifetime,
 							max_assignments=max_assignments,
-							requester_annotation=requester_annotation)
+							requester_annotation=requester_annotation,
+							unique_request_token=unique_request_token)
 		return hit
 
-	def _create_hit_from_html(self, html, height, max_assignments=None, lifetime=None, requester_annotation=None):
+	def _create_hit_from_html(self, html, height, max_assignments=None, lifetime=None, requester_annotation=None, unique_request_token=None):
 		hit = self._amt.create_hit_from_html(
 							html=html,
 							frame_height=height,
 							hit_type=self,
 							lifetime=lifetime,
 							max_assignments=max_assignments,
-							requester_annotation=requester_annotation)
+							requester_annotation=requester_annotation,
+							unique_request_token=unique_request_token)
 		return hit
 
-	def _create_hit_from_xml(self, question_xml, max_assignments=None, lifetime=None, requester_annotation=None):
+	def _create_hit_from_xml(self, question_xml, max_assignments=None, lifetime=None, requester_annotation=None, unique_request_token=None):
 		try:
 			hit = self._amt.create_hit(
 						hit_type=self,
 						question_xml=question_xml,
 						max_assignments=max_assignments,
 						lifetime=lifetime,
-						requester_annotation=requester_annotation)
+						requester_annotation=requester_annotation,
+						unique_request_token=unique_request_token)
 		except AMTRequestFailed:
 			e = sys.exc_info()[1]
 			if e.code=="AWS.MechanicalTurk.XMLParseError":
 				raise QuestionXMLError(question_xml, e.code, e.msg)
 		return hit
 
-	def _create_hit_from_fields(self, fields, lifetime=None, max_assignments=None, requester_annotation=None):
+	def _create_hit_from_fields(self, fields, lifetime=None, max_assignments=None, requester_annotation=None, unique_request_token=None):
 		if not is_iterable(fields):
 			fields = (fields,)
 		hit = self._amt.create_hit_from_fields(
@@ -279,7 +283,8 @@ class HITType( object ):
 							hit_type=self,
 							lifetime=lifetime,
 							max_assignments=max_assignments,
-							requester_annotation=requester_annotation)
+							requester_annotation=requester_annotation,
+							unique_request_token=unique_request_token)
 		return hit
 
 	def __repr__(self):
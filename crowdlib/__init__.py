@@ -232,6 +232,15 @@ def get_account_balance():
 def sync_with_amt():
 	_.get_amt().sync_with_amt()
 
+def get_connection_metrics():
+	return _.get_amt().get_connection_metrics()
+
+def get_rate_limit_stats():
+	return _.get_amt().get_rate_limit_stats()
+
+def get_retry_stats():
+	return _.get_amt().get_retry_stats()
+
 def set_all_hits_unavailable():
 	_.get_amt().set_all_hits_unavailable()
 
@@ -47,6 +47,37 @@ class AMTRequestFailed( CrowdLibBaseException ): # [pylint] doesn't call super(.
 		return "AMTRequestFailed( %s, %s, %s )"%( self.code, self.msg, self.operation )
 
 
+class AMTHTTPError(IOError):
+	'''
+	AMT answered with an HTTP error status (5xx) instead of an XML response.
+	'''
+	def __init__(self, status, reason):
+		IOError.__init__(self, "AMT responded with HTTP %d %s"%(status, reason))
+		self.status = status
+		self.reason = reason
+
+
+class AMTResponseLostError(IOError):
+	'''
+	The request reached AMT but no complete response came back (i.e., it timed out), so AMT may
+	or may not have acted on it.
+	'''
+	pass
+
+
+class AMTCircuitOpenError(CrowdLibBaseException): # [pylint] doesn't call super(..).__init__(..) : pylint:disable=W0231
+	'''
+	Requests to AMT have been failing, so this one was not sent.  Try again after retry_after seconds.
+	'''
+	def __init__(self, operation, retry_after): # [pylint] doesn't call super(..).__init__(..) : pylint:disable=W0231
+		self.operation = operation
+		self.retry_after = retry_after
+
+	def __str__(self):
+		return "%s not sent because requests to AMT keep failing.  Try again in %.1f seconds."%(self.operation, self.retry_after)
+	__repr__ = __str__
+
+
 class AMTNotificationNotAvailable(CrowdLibBaseException):
 	pass
 